@@ -7,7 +7,8 @@ from typing import Union
 import click
 
 from ontodiff_curator import __version__
-from ontodiff_curator.main import analyze_repo, scrape_repo
+from ontodiff_curator.main import APIS, DEFAULT_WORKERS, OBO_CACHE_SIZE, analyze_repo, scrape_repo
+from ontodiff_curator.utils import CACHE_BACKENDS, install_cache
 
 __all__ = [
     "main",
@@ -27,11 +28,53 @@ token_option = click.option(
     required=False,
     help="Github token for the repository.",
 )
-output_option = click.option("-o", "--output-file", help="Path to the output YAML file.")
+output_option = click.option("-o", "--output-file", help="Path to the output file.")
+input_option = click.option(
+    "-i",
+    "--input-file",
+    help="Path to the scraped data file. Defaults to the raw_data file, in any format, of the repository.",
+)
 max_pr_option = click.option("--max-pr", type=int, default=None, help="Latest PR to scrape.")
 min_pr_option = click.option("--min-pr", type=int, default=None, help="Earliest PR to scrape.")
 overwrite_option = click.option("--overwrite/--no-overwrite", default=True, help="Enable or disable overwriting.")
 from_pr_option = click.option("--from-pr", type=int, default=None, help="Earliest PR to analyze.")
+workers_option = click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    help="Number of PRs to scrape concurrently.",
+)
+analyze_workers_option = click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of processes diffing PRs concurrently. Each holds several parsed ontologies in memory.",
+)
+api_option = click.option(
+    "--api",
+    type=click.Choice(APIS),
+    default="rest",
+    show_default=True,
+    help="GitHub API to fetch PRs with. 'graphql' fetches PRs in batches but only finds issues a PR closes.",
+)
+cache_backend_option = click.option(
+    "--cache-backend",
+    type=click.Choice(CACHE_BACKENDS),
+    default="sqlite",
+    show_default=True,
+    help="Backend of the HTTP cache for GitHub requests.",
+)
+obo_cache_size_option = click.option(
+    "--obo-cache-size",
+    type=float,
+    default=OBO_CACHE_SIZE / (1 << 30),
+    show_default=True,
+    help="Maximum size in GiB of the OBO files kept between runs, least recently used first out. 0 keeps none.",
+)
 pr_status_option = click.option(
     "--pr-status",
     type=click.Choice(["open", "closed"], case_sensitive=False),
@@ -69,21 +112,45 @@ def main(verbose: int, quiet: bool):
 @min_pr_option
 @pr_status_option
 @overwrite_option
+@workers_option
+@api_option
+@cache_backend_option
 def scrape(
-    repo: str, token: str, output_file: Union[Path, str], max_pr: int, min_pr: int, pr_status: str, overwrite: bool
+    repo: str,
+    token: str,
+    output_file: Union[Path, str],
+    max_pr: int,
+    min_pr: int,
+    pr_status: str,
+    overwrite: bool,
+    workers: int,
+    api: str,
+    cache_backend: str,
 ):
     """Run the ontodiff-curator's scrape command."""
-    scrape_repo(repo, token, output_file, max_pr, min_pr, pr_status, overwrite)
+    install_cache(cache_backend)
+    scrape_repo(repo, token, output_file, max_pr, min_pr, pr_status, overwrite, workers, api)
 
 
 @main.command()
 @repo_option
 @token_option
+@input_option
 @output_option
 @overwrite_option
-def analyze(repo: str, token: str, output_file: Union[Path, str], overwrite: bool):
+@analyze_workers_option
+@obo_cache_size_option
+def analyze(
+    repo: str,
+    token: str,
+    input_file: Union[Path, str],
+    output_file: Union[Path, str],
+    overwrite: bool,
+    workers: int,
+    obo_cache_size: float,
+):
     """Run the ontodiff-curator's analyze command."""
-    analyze_repo(repo, token, output_file, overwrite)
+    analyze_repo(repo, token, output_file, overwrite, workers, int(obo_cache_size * (1 << 30)), input_file=input_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+"""GitHub GraphQL queries for the OntoDiff Curator."""
+
+from typing import Iterator, List
+
+import requests
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+GRAPHQL_TIMEOUT = 30  # seconds
+
+PULL_REQUEST_FIELDS = """
+fragment PullRequestFields on PullRequest {
+  number
+  title
+  body
+  merged
+  baseRefOid
+  headRefOid
+  labels(first: 50) { nodes { name } }
+  reviewThreads(first: 100) { nodes { comments(first: 100) { nodes { body } } } }
+  files(first: 30) { nodes { path } pageInfo { hasNextPage endCursor } }
+  closingIssuesReferences(first: 10) {
+    nodes {
+      number
+      title
+      body
+      labels(first: 50) { nodes { name } }
+      comments(first: 100) { nodes { body } }
+    }
+  }
+}
+"""
+
+PULL_REQUEST_FILES_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $cursor: String!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $cursor) { nodes { path } pageInfo { hasNextPage endCursor } }
+    }
+  }
+}
+"""
+
+
+MERGED_PULL_REQUESTS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: MERGED, first: 100, after: $cursor, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { number }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+
+def run_query(session: requests.Session, query: str, variables: dict) -> dict:
+    """
+    Run a GraphQL query against the GitHub API.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param query: GraphQL query.
+    :param variables: Values of the query variables.
+    :return: The ``data`` member of the response.
+    """
+    response = session.post(GRAPHQL_URL, json={"query": query, "variables": variables}, timeout=GRAPHQL_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+    if result.get("errors"):
+        raise RuntimeError(f"GraphQL query failed: {result['errors']}")
+    return result["data"]
+
+
+def _pull_requests_query(numbers: List[int]) -> str:
+    """Build a query fetching several pull requests at once, each under an alias named after its number."""
+    fields = "\n".join(
+        f"    pr{number}: pullRequest(number: {number}) {{ ...PullRequestFields }}" for number in numbers
+    )
+    return f"""
+query($owner: String!, $name: String!) {{
+  repository(owner: $owner, name: $name) {{
+{fields}
+  }}
+}}
+{PULL_REQUEST_FIELDS}"""
+
+
+def _changed_paths(session: requests.Session, variables: dict, files: dict, path_suffix: str = None) -> List[str]:
+    """
+    Collect the paths of the changed files of a pull request, fetching further pages as needed.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param variables: Owner, name and number of the pull request.
+    :param files: First page of the ``files`` connection.
+    :param path_suffix: If given, only keep the first path ending with it and stop paging once it is found.
+    :return: Paths of the changed files.
+    """
+    paths = []
+    while True:
+        paths.extend(node["path"] for node in files["nodes"])
+        if path_suffix is not None:
+            matched = next((path for path in paths if path.endswith(path_suffix)), None)
+            if matched is not None:
+                return [matched]
+            paths = []
+        if not files["pageInfo"]["hasNextPage"]:
+            return paths
+        cursor = files["pageInfo"]["endCursor"]
+        data = run_query(session, PULL_REQUEST_FILES_QUERY, {**variables, "cursor": cursor})
+        files = data["repository"]["pullRequest"]["files"]
+
+
+def fetch_pull_requests(
+    session: requests.Session, repo: str, numbers: List[int], path_suffix: str = None
+) -> List[dict]:
+    """
+    Fetch pull requests with their labels, review comments, changed files and the issues they close.
+
+    All pull requests are fetched with a single query; only changed files beyond the first page need more.
+    Issues come from ``closingIssuesReferences``, i.e. those GitHub links to a pull request as closed by it.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :param numbers: Numbers of the pull requests.
+    :param path_suffix: If given, only keep the first changed file ending with it and stop paging through the
+        files once it is found.
+    :return: The ``pullRequest`` nodes in the order of ``numbers``, with the paths of the changed files in ``files``.
+    """
+    owner, name = repo.split("/")
+    repository = run_query(session, _pull_requests_query(numbers), {"owner": owner, "name": name})["repository"]
+    pull_requests = [repository[f"pr{number}"] for number in numbers]
+    for pull_request in pull_requests:
+        variables = {"owner": owner, "name": name, "number": pull_request["number"]}
+        pull_request["files"] = _changed_paths(session, variables, pull_request["files"], path_suffix)
+    return pull_requests
+
+
+def iter_merged_pull_request_numbers(session: requests.Session, repo: str) -> Iterator[int]:
+    """
+    Iterate over the numbers of the merged pull requests of a repository, newest first, 100 per query.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :return: Iterator over pull request numbers.
+    """
+    owner, name = repo.split("/")
+    cursor = None
+    while True:
+        data = run_query(session, MERGED_PULL_REQUESTS_QUERY, {"owner": owner, "name": name, "cursor": cursor})
+        pull_requests = data["repository"]["pullRequests"]
+        for node in pull_requests["nodes"]:
+            yield node["number"]
+        if not pull_requests["pageInfo"]["hasNextPage"]:
+            return
+        cursor = pull_requests["pageInfo"]["endCursor"]
@@ -1,23 +1,30 @@
 """Main module for the OntoDiffCurator package."""
 
 import datetime
-import io
+import json
 import logging
+import re
 import shutil
+import tempfile
+import threading
 import time
-from os import makedirs
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from multiprocessing import get_context
+from operator import attrgetter
+from os import getpid, makedirs, replace, utime
 from pathlib import Path
-from typing import Union
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
 
 import requests
-import requests_cache
 import yaml
-from github import Github, RateLimitExceededException
+from github import RateLimitExceededException
 from oaklib import get_adapter
 from oaklib.io.streaming_kgcl_writer import StreamingKGCLWriter
 
 from ontodiff_curator.constants import (
-    CHANGES_KEY,
     FILENAME_KEY,
     ISSUE_BODY_KEY,
     ISSUE_COMMENTS_KEY,
@@ -35,14 +42,31 @@ from ontodiff_curator.constants import (
     URL_IN_MAIN_KEY,
     URL_IN_PR_KEY,
 )
-from ontodiff_curator.utils import PROJECT_DIR, check_rate_limit, download_file, owl2obo
+from ontodiff_curator.github_graphql import fetch_pull_requests, iter_merged_pull_request_numbers
+from ontodiff_curator.utils import (
+    PROJECT_DIR,
+    RateLimitMonitor,
+    SafeDumper,
+    commit_sha_from_url,
+    download_file,
+    dump_pull_requests,
+    file_digest,
+    get_github,
+    get_session,
+    iter_issues,
+    iter_pull_requests,
+    list_issue_comments,
+    list_review_comments,
+    owl2obo,
+    prune_cache,
+    scratch_dir,
+    truncate_partial_record,
+)
+from ontodiff_curator.yaml_fast import CHANGE_PREFIX, LinePrefixWriter, changes_header
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Initialize requests_cache
-requests_cache.install_cache("github_cache")
-
 REPO_RESOURCE_MAP = {
     "monarch-initiative/mondo": "mondo-edit.obo",
     "pato-ontology/pato": "pato-edit.obo",
@@ -51,9 +75,352 @@ REPO_RESOURCE_MAP = {
     "obophenotype/cell-ontology": "cl-edit.owl",
     "geneontology/go-ontology": "go-edit.obo",
 }
-RAW_DATA_FILENAME = "raw_data.yaml"
+RAW_DATA_FILENAME = "raw_data.msgpack"
+LEGACY_RAW_DATA_FILENAME = "raw_data.yaml"
+# Scraped data files analyze looks for, in any of the formats scrape writes
+RAW_DATA_FILENAMES = (RAW_DATA_FILENAME, "raw_data.jsonl", LEGACY_RAW_DATA_FILENAME)
+PROGRESS_SUFFIX = ".progress.json"
 DATA_WITH_CHANGES_FILENAME = "data_with_changes.yaml"
 TMP_DIR_NAME = "tmp"
+OBO_CACHE_DIR_NAME = "cache"
+OBO_CACHE_SIZE = 10 << 30  # bytes of OBO resources kept across analyze runs
+DEFAULT_WORKERS = 4
+APIS = ("rest", "graphql")
+GRAPHQL_BATCH_SIZE = 10  # Pull requests per GraphQL query
+SCRAPE_BATCHES_PER_WORKER = 4  # Batches queued per worker while the output is written
+PROGRESS_INTERVAL = 50  # Pull requests handled between flushes of the scrape output and its progress
+ADAPTER_CACHE_SIZE = 4
+PREFETCH_MIN_PRS = 1000  # Pull requests in range from which all issues and comments are listed up front
+ANALYZE_CHUNK_SIZE = 8  # Consecutive pull requests handed to a worker at once
+ANALYZE_CHUNKS_PER_WORKER = 2  # Chunks queued per worker while the output is written
+
+# Issue references such as "#123", "(#123)" or "closes:#123" in a PR body, but not "#123abc", references to
+# other repositories such as "owner/repo#123" or HTML entities such as "&#123;"
+_ISSUE_RE = re.compile(r"(?<![\w/&])#(\d+)\b")
+
+
+def _repo_slug(repo: str) -> str:
+    """Name of the directory holding the data of a repository, e.g. ``pato-ontology_pato``."""
+    return repo.replace("/", "_")
+
+
+def _filter_pull_requests(pull_requests, max_pr_number=None, min_pr_number=None, number=attrgetter("number")):
+    """
+    Yield the pull requests within the requested number range.
+
+    Pull requests must be sorted by number in descending order, so iteration stops,
+    and no further pages are fetched, once ``min_pr_number`` is passed.
+
+    :param pull_requests: Pull requests sorted newest first.
+    :param max_pr_number: Latest PR to yield.
+    :param min_pr_number: Earliest PR to yield.
+    :param number: Function returning the number of a pull request.
+    """
+    for pr in pull_requests:
+        if max_pr_number and number(pr) > max_pr_number:
+            continue
+        if min_pr_number and number(pr) < min_pr_number:
+            break
+        yield pr
+
+
+def _pr_numbers(data_path: Path) -> Set[int]:
+    """
+    Collect the numbers of the pull requests in a scraped or analyzed data file.
+
+    An analyzed file holds only its metadata until the first pull request with changes is written,
+    so documents other than pull requests are skipped.
+
+    :param data_path: Path to the data file.
+    :return: Pull request numbers.
+    """
+    return {int(pr[PR_NUMBER_KEY].strip("pr")) for pr in iter_pull_requests(data_path) if PR_NUMBER_KEY in pr}
+
+
+def _read_progress(progress_file: Path) -> Optional[int]:
+    """
+    Read the number of the last pull request handled by a previous scrape.
+
+    :param progress_file: Path to the progress file.
+    :return: Pull request number, or None if there is no progress recorded.
+    """
+    if not progress_file.exists():
+        return None
+    with open(progress_file, "r") as file:
+        return json.load(file)["last_pr"]
+
+
+def _progress_file(output_file: Path) -> Path:
+    """Path of the progress file of a scrape, next to its output, e.g. ``raw_data.progress.json``."""
+    return output_file.with_suffix(PROGRESS_SUFFIX)
+
+
+def _resume_max_pr_number(max_pr_number: Optional[int], last_pr_number: Optional[int]) -> Optional[int]:
+    """
+    Narrow the requested range to the pull requests below the last one handled by an interrupted scrape.
+
+    :param max_pr_number: Latest PR requested, or None for no upper bound.
+    :param last_pr_number: Last PR handled, or None if there is no progress recorded.
+    :return: Latest PR to scrape.
+    """
+    if last_pr_number is None:
+        return max_pr_number
+    return min(max_pr_number or last_pr_number - 1, last_pr_number - 1)
+
+
+def _write_progress(progress_file: Path, pr_number: int) -> None:
+    """
+    Record the number of the last pull request handled, replacing the progress file atomically.
+
+    :param progress_file: Path to the progress file.
+    :param pr_number: Pull request number.
+    """
+    partial_file = progress_file.with_suffix(".part")
+    with open(partial_file, "w") as file:
+        json.dump({"last_pr": pr_number}, file)
+    replace(partial_file, progress_file)
+
+
+def _get_issue_data(repository, issue_number: int, issue_cache: Dict[int, Future]) -> Optional[dict]:
+    """
+    Collect the data of an issue, reusing the result for issues seen earlier in the scrape.
+
+    Concurrent requests for the same issue wait for the first one rather than fetching it again.
+
+    :param repository: GitHub repository the issue belongs to.
+    :param issue_number: Number of the issue.
+    :param issue_cache: Future issue data by issue number, shared across pull requests.
+    :return: Issue data, or None if the number refers to a pull request.
+    """
+    future = Future()
+    cached = issue_cache.setdefault(issue_number, future)
+    if cached is not future:
+        return cached.result()
+    try:
+        issue = repository.get_issue(issue_number)
+        issue_data = None
+        if not issue.pull_request:
+            issue_data = {
+                ISSUE_NUMBER_KEY: issue.number,
+                ISSUE_TITLE_KEY: issue.title,
+                ISSUE_BODY_KEY: issue.body,
+                ISSUE_LABELS_KEY: [label.name for label in issue.labels],
+                ISSUE_COMMENTS_KEY: [comment.body for comment in issue.get_comments()],
+            }
+    except Exception as e:
+        # Let a later pull request try again
+        del issue_cache[issue_number]
+        future.set_exception(e)
+        raise
+    future.set_result(issue_data)
+    return issue_data
+
+
+def _spans_many_prs(max_pr_number: Optional[int], min_pr_number: Optional[int]) -> bool:
+    """
+    Tell whether a range of pull requests is unbounded or spans at least ``PREFETCH_MIN_PRS`` numbers.
+
+    A range with only a lower bound is of unknown size, and is not counted as spanning many.
+
+    :param max_pr_number: Latest PR in range, or None for no upper bound.
+    :param min_pr_number: Earliest PR in range, or None for no lower bound.
+    """
+    if max_pr_number is None:
+        return min_pr_number is None
+    return max_pr_number - (min_pr_number or 1) + 1 >= PREFETCH_MIN_PRS
+
+
+def _prefetch_issues(session: requests.Session, repo: str, monitor: RateLimitMonitor) -> Dict[int, Future]:
+    """
+    Collect the data of all issues of a repository up front, in the form of the cache of :func:`_get_issue_data`.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :param monitor: Rate limit monitor gating each request.
+    :return: Resolved future issue data by issue number, None for pull requests.
+    """
+    comments = list_issue_comments(session, repo, monitor)
+    issue_cache = {}
+    for issue in iter_issues(session, repo, monitor):
+        issue_data = None
+        if "pull_request" not in issue:
+            issue_data = {
+                ISSUE_NUMBER_KEY: issue["number"],
+                ISSUE_TITLE_KEY: issue["title"],
+                ISSUE_BODY_KEY: issue["body"],
+                ISSUE_LABELS_KEY: [label["name"] for label in issue["labels"]],
+                ISSUE_COMMENTS_KEY: comments.get(issue["number"], []),
+            }
+        future = Future()
+        future.set_result(issue_data)
+        issue_cache[issue["number"]] = future
+    return issue_cache
+
+
+def _file_data(repo: str, filename: str, base_commit_sha: str, head_commit_sha: str) -> dict:
+    """
+    Collect the URLs of a changed file on the main branch just before the PR was merged and in the PR.
+
+    :param repo: Org/name of the GitHub repo.
+    :param filename: Path of the file in the repository.
+    :param base_commit_sha: Commit SHA of the main branch the PR is based on.
+    :param head_commit_sha: Commit SHA of the head of the PR.
+    :return: File data.
+    """
+    return {
+        FILENAME_KEY: filename,
+        URL_IN_MAIN_KEY: f"https://github.com/{repo}/raw/{base_commit_sha}/{filename}",
+        URL_IN_PR_KEY: f"https://github.com/{repo}/raw/{head_commit_sha}/{filename}",
+    }
+
+
+def _process_pr(
+    pr,
+    repository,
+    repo: str,
+    target_suffix: str,
+    monitor: RateLimitMonitor,
+    issue_cache: Dict[int, Future],
+    issue_executor: Executor,
+    review_comments: Optional[Dict[int, List[str]]] = None,
+):
+    """
+    Collect the data of a single pull request.
+
+    :param pr: Pull request to process.
+    :param repository: GitHub repository the pull request belongs to.
+    :param repo: Org/name of the GitHub repo.
+    :param target_suffix: Path suffix of the ontology resource file, e.g. ``/pato-edit.obo``.
+    :param monitor: Rate limit monitor gating the request.
+    :param issue_cache: Future issue data by issue number, shared across pull requests.
+    :param issue_executor: Executor fetching the issues referenced by the pull request.
+    :param review_comments: Review comments by pull request number, listed up front for the whole repository.
+        If None, the comments are fetched for the pull request.
+    :return: Pull request data if it is merged, changes the resource and closes an issue, else None.
+        Failures are logged and raised, so the pull request is not recorded as handled.
+    """
+    # The listing already tells whether the pull request was merged
+    if pr.merged_at is None:
+        return None
+    monitor.wait()
+    try:
+        # Get issues linked to the pull request, each fetched once however often it is mentioned
+        issue_numbers = dict.fromkeys(map(int, _ISSUE_RE.findall(pr.body or "")))
+        if not issue_numbers:
+            logging.info(f"No issues linked to PR #{pr.number}")
+            return None
+
+        # Get the resource among the changed files, before fetching the comments and issues of a PR
+        # that does not touch it
+        matched = next((file for file in pr.get_files() if file.filename.endswith(target_suffix)), None)
+        if matched is None:
+            return None
+
+        # Initialize data structure for the pull request
+        pr_entry = {
+            PR_NUMBER_KEY: f"pr{pr.number}",
+            PR_TITLE_KEY: pr.title,
+            PR_BODY_KEY: pr.body,
+            PR_LABELS_KEY: [label.name for label in pr.labels],
+            PR_COMMENTS_KEY: (
+                review_comments.get(pr.number, [])
+                if review_comments is not None
+                else [comment.body for comment in pr.get_comments()]
+            ),
+            PR_CLOSED_ISSUES_KEY: [],
+            PR_CHANGED_FILES_KEY: [_file_data(repo, matched.filename, pr.base.sha, pr.head.sha)],
+        }
+
+        # All referenced issues are fetched concurrently
+        fetch_issue = partial(_get_issue_data, repository, issue_cache=issue_cache)
+        for issue_data in issue_executor.map(fetch_issue, issue_numbers):
+            if issue_data is not None:
+                pr_entry[PR_CLOSED_ISSUES_KEY].append(issue_data)
+
+        if len(pr_entry[PR_CHANGED_FILES_KEY]) > 0 and len(pr_entry[PR_CLOSED_ISSUES_KEY]) > 0:
+            return pr_entry
+
+    except RateLimitExceededException:
+        logging.error("Rate limit exceeded. Sleeping for 60 seconds.")
+        time.sleep(60)
+        raise
+    except Exception as e:
+        logging.error(f"Failed to fetch issue or files for PR #{pr.number}: {e}")
+        raise
+    return None
+
+
+def _graphql_pr_entry(repo: str, node: dict) -> Optional[dict]:
+    """
+    Collect the data of a pull request from its GraphQL node.
+
+    The closed issues are the ones GitHub links to the pull request as closed by it.
+
+    :param repo: Org/name of the GitHub repo.
+    :param node: ``pullRequest`` node, with only the changed resource file in ``files``.
+    :return: Pull request data if it is merged, changes the resource and closes an issue, else None.
+    """
+    if not node["merged"]:
+        return None
+    pr_entry = {
+        PR_NUMBER_KEY: f"pr{node['number']}",
+        PR_TITLE_KEY: node["title"],
+        PR_BODY_KEY: node["body"],
+        PR_LABELS_KEY: [label["name"] for label in node["labels"]["nodes"]],
+        PR_COMMENTS_KEY: [
+            comment["body"] for thread in node["reviewThreads"]["nodes"] for comment in thread["comments"]["nodes"]
+        ],
+        PR_CLOSED_ISSUES_KEY: [
+            {
+                ISSUE_NUMBER_KEY: issue["number"],
+                ISSUE_TITLE_KEY: issue["title"],
+                ISSUE_BODY_KEY: issue["body"],
+                ISSUE_LABELS_KEY: [label["name"] for label in issue["labels"]["nodes"]],
+                ISSUE_COMMENTS_KEY: [comment["body"] for comment in issue["comments"]["nodes"]],
+            }
+            for issue in node["closingIssuesReferences"]["nodes"]
+        ],
+        PR_CHANGED_FILES_KEY: [
+            _file_data(repo, path, node["baseRefOid"], node["headRefOid"]) for path in node["files"]
+        ],
+    }
+    if len(pr_entry[PR_CHANGED_FILES_KEY]) > 0 and len(pr_entry[PR_CLOSED_ISSUES_KEY]) > 0:
+        return pr_entry
+    return None
+
+
+def _process_prs_graphql(
+    pr_numbers: List[int],
+    repo: str,
+    target_suffix: str,
+    session: requests.Session,
+    monitor: RateLimitMonitor,
+) -> List[Optional[dict]]:
+    """
+    Collect the data of a batch of pull requests with one GraphQL query.
+
+    :param pr_numbers: Numbers of the pull requests to process.
+    :param repo: Org/name of the GitHub repo.
+    :param target_suffix: Path suffix of the ontology resource file, e.g. ``/pato-edit.obo``.
+    :param session: Pooled HTTP session for the GraphQL API.
+    :param monitor: Rate limit monitor gating the request.
+    :return: For each pull request, its data if it changes the resource and closes an issue, else None.
+        Failures are logged and raised, so the batch is not recorded as handled.
+    """
+    monitor.wait()
+    try:
+        nodes = fetch_pull_requests(session, repo, pr_numbers, path_suffix=target_suffix)
+    except Exception as e:
+        logging.error(f"Failed to fetch PRs #{pr_numbers[0]} to #{pr_numbers[-1]}: {e}")
+        raise
+    return [_graphql_pr_entry(repo, node) for node in nodes]
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of ``size`` consecutive items, the last one possibly shorter."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
 def scrape_repo(
@@ -64,145 +431,358 @@ def scrape_repo(
     min_pr_number=None,
     pr_status="merged",
     overwrite: bool = True,
+    workers: int = DEFAULT_WORKERS,
+    api: str = "rest",
 ) -> None:
     """
     Get pull requests and corresponding issues they close along with the ontology resource files.
 
     We collect the URLs of the resource files in the PR and also the main branch just before the PR was merged.
+    Pull requests are fetched concurrently by a pool of worker threads.
 
     :param repo: Org/name of the GitHub repo.
     :param token: GitHub token for the repository.
-    :param output_file: Path to the output YAML file.
+    :param output_file: Path to the output file, written as msgpack if it ends in ``.msgpack``,
+        as JSON Lines if it ends in ``.jsonl`` and as YAML otherwise.
+    :param workers: Number of pull requests to fetch concurrently.
+    :param api: GitHub API to fetch each pull request with, "rest" or "graphql".
+        The GraphQL API fetches pull requests in batches of one query each, but only finds
+        the issues GitHub links as closed by the pull request.
     """
     logging.info(f"Starting scrape for repo: {repo}")
-    g = Github(token)
-    file_of_interest = REPO_RESOURCE_MAP.get(repo)
+    # Both the PR and the issue workers talk to the API
+    g = get_github(token, pool_size=2 * workers)
+    target_suffix = f"/{REPO_RESOURCE_MAP.get(repo)}"
     repository = g.get_repo(repo)
-    first_line_written = False
 
     # Set default output file path if not provided
     if not output_file:
-        output_file = Path.cwd() / f"{repo.replace('/', '_')}/{RAW_DATA_FILENAME}"
+        output_file = Path.cwd() / _repo_slug(repo) / RAW_DATA_FILENAME
         if output_file.exists() and overwrite:
             output_file.unlink()
+    output_file = Path(output_file)
 
     # Create directories if they do not exist
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
-    # Get closed pull requests
-    pull_requests = repository.get_pulls(state=pr_status)
-
-    # Filter pull requests based on the PR number
-    if max_pr_number:
-        pull_requests = [pr for pr in pull_requests if pr.number <= max_pr_number]
-    if min_pr_number:
-        pull_requests = [pr for pr in pull_requests if pr.number >= min_pr_number]
-
-    for pr in pull_requests:
-        merge_url = f"https://api.github.com/repos/{repo}/pulls/{pr.number}/merge"
-        merge_response = requests.get(merge_url, timeout=10, headers={"Authorization": f"token {token}"})
-        if merge_response.status_code == 204:
-            try:
-                # Initialize data structure for the pull request
-                pr_entry = {
-                    PR_NUMBER_KEY: f"pr{pr.number}",
-                    PR_TITLE_KEY: pr.title,
-                    PR_BODY_KEY: pr.body,
-                    PR_LABELS_KEY: [label.name for label in pr.labels],
-                    PR_COMMENTS_KEY: [comment.body for comment in pr.get_comments()],
-                    PR_CLOSED_ISSUES_KEY: [],
-                    PR_CHANGED_FILES_KEY: [],
-                }
-
-                # Get issues linked to the pull request
-                if pr.body:
-                    issue_numbers = [
-                        int(word[1:]) for word in pr.body.split() if word.startswith("#") and word[1:].isdigit()
-                    ]
-                    for issue_number in issue_numbers:
-                        issue = repository.get_issue(issue_number)
-                        if not issue.pull_request:
-                            # Collect issue data
-                            issue_data = {
-                                ISSUE_NUMBER_KEY: issue.number,
-                                ISSUE_TITLE_KEY: issue.title,
-                                ISSUE_BODY_KEY: issue.body,
-                                ISSUE_LABELS_KEY: [label.name for label in issue.labels],
-                                ISSUE_COMMENTS_KEY: [comment.body for comment in issue.get_comments()],
-                            }
-
-                            pr_entry[PR_CLOSED_ISSUES_KEY].append(issue_data)
-
-                    # Get changed files in the PR
-                    files = pr.get_files()
-                    for file in files:
-                        if file.filename.endswith(f"/{file_of_interest}"):
-                            # Get the commit SHA of the main branch just before the PR was merged
-                            base_commit_sha = pr.base.sha
-                            head_commit_sha = pr.head.sha
-
-                            # Construct URLs
-                            url_on_main = f"https://github.com/{repo}/raw/{base_commit_sha}/{file.filename}"
-                            url_in_pr = f"https://github.com/{repo}/raw/{head_commit_sha}/{file.filename}"
-
-                            # Collect file data
-                            file_data = {
-                                FILENAME_KEY: file.filename,
-                                URL_IN_MAIN_KEY: url_on_main,
-                                URL_IN_PR_KEY: url_in_pr,
-                            }
-                            pr_entry[PR_CHANGED_FILES_KEY].append(file_data)
-
-                    # Write data to YAML file if conditions are met
-                    if len(pr_entry[PR_CHANGED_FILES_KEY]) > 0 and len(pr_entry[PR_CLOSED_ISSUES_KEY]) > 0:
-                        if not first_line_written:
-                            with open(output_file, "a") as file:
-                                yaml.dump({PULL_REQUESTS_KEY: [pr_entry]}, file, sort_keys=False)
-                            first_line_written = True
-                        else:
-                            with open(output_file, "a") as file:
-                                yaml.dump([pr_entry], file, default_flow_style=False, indent=2, sort_keys=False)
-                        logging.info(f"Data for PR #{pr.number} written to {output_file}")
+    # Resume below the last pull request handled by an interrupted run, skipping any already in the output.
+    # A completed run leaves no progress file, so a new run also picks up the pull requests opened since.
+    progress_file = _progress_file(output_file)
+    pr_numbers_scraped = set()
+    if overwrite:
+        progress_file.unlink(missing_ok=True)
+    else:
+        last_pr_number = _read_progress(progress_file)
+        if last_pr_number is not None:
+            logging.info(f"Resuming scrape below PR #{last_pr_number}")
+        max_pr_number = _resume_max_pr_number(max_pr_number, last_pr_number)
+        if output_file.exists():
+            # An interrupted run may have stopped in the middle of a record, which would swallow those appended
+            truncate_partial_record(output_file)
+            pr_numbers_scraped = _pr_numbers(output_file)
+
+    # Share one connection pool between the worker threads
+    session = get_session(token, pool_size=workers)
+
+    # Get pull requests, newest first, and filter them based on the PR number. The GraphQL API lists
+    # only the merged ones, so the others are never fetched.
+    if api == "graphql":
+        pull_requests = iter_merged_pull_request_numbers(session, repo)
+        pr_number = int
+    else:
+        pull_requests = repository.get_pulls(state=pr_status, sort="created", direction="desc")
+        pr_number = attrgetter("number")
+    pull_requests = (
+        pr
+        for pr in _filter_pull_requests(pull_requests, max_pr_number, min_pr_number, number=pr_number)
+        if pr_number(pr) not in pr_numbers_scraped
+    )
+
+    # Issues are fetched on their own pool, so a PR waiting on its issues never blocks another PR's slot
+    issue_executor = ThreadPoolExecutor(max_workers=workers)
+    monitor = RateLimitMonitor(g, threshold=10 * workers, resource="graphql" if api == "graphql" else "core")
+    monitor.start()
+    try:
+        if api == "graphql":
+            process_prs = partial(
+                _process_prs_graphql, repo=repo, target_suffix=target_suffix, session=session, monitor=monitor
+            )
+            batch_size = GRAPHQL_BATCH_SIZE
+        else:
+            # Over many pull requests, listing all issues and review comments takes far fewer requests than
+            # fetching them per pull request. Issues missing from the listing, e.g. transferred ones, are still
+            # fetched one by one.
+            prefetch = _spans_many_prs(max_pr_number, min_pr_number)
+            process_pr = partial(
+                _process_pr,
+                repository=repository,
+                repo=repo,
+                target_suffix=target_suffix,
+                monitor=monitor,
+                issue_cache=_prefetch_issues(session, repo, monitor) if prefetch else {},
+                issue_executor=issue_executor,
+                review_comments=list_review_comments(session, repo, monitor) if prefetch else None,
+            )
+
+            def process_prs(prs):
+                return [process_pr(pr) for pr in prs]
+
+            batch_size = 1
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # The listing is consumed as the results are written, so only the queued batches are held in memory
+            batches = _batched(pull_requests, batch_size)
+
+            def submit(batch):
+                return executor.submit(process_prs, batch), pr_number(batch[-1])
+
+            pending = deque(submit(batch) for batch in islice(batches, workers * SCRAPE_BATCHES_PER_WORKER))
+            failed = False
+            last_handled = None
+
+            def completed_entries(file):
+                nonlocal failed, last_handled
+                # Results are taken in listing order, so every PR above the recorded one has been handled.
+                # Every PROGRESS_INTERVAL PRs the file is flushed and then its progress recorded. Progress stops
+                # at the first batch that failed, already logged by its worker, so a resumed run retries it.
+                unrecorded = 0
+                while pending:
+                    future, last_pr_number = pending.popleft()
+                    # Keep the workers busy while this batch is written
+                    pending.extend(submit(batch) for batch in islice(batches, 1))
+                    try:
+                        pr_entries = future.result()
+                    except Exception:
+                        failed = True
+                        continue
+                    for pr_entry in pr_entries:
+                        if pr_entry is not None:
+                            yield pr_entry
+                            logging.info(f"Data for PR #{pr_entry[PR_NUMBER_KEY][2:]} written to {output_file}")
+                    if failed:
                         continue
-                else:
-                    logging.info(f"No issues linked to PR #{pr.number}")
-
-                # Check rate limit and sleep if necessary
-                remaining, reset_timestamp, current_timestamp = check_rate_limit(g)
-                if remaining < 10:
-                    sleep_time = max(0, reset_timestamp - current_timestamp + 10)  # Add buffer time
-                    logging.info(f"Rate limit low. Sleeping for {sleep_time} seconds.")
-                    time.sleep(sleep_time)
-                else:
-                    time.sleep(0.72)  # Sleep to avoid hitting rate limit
-
-            except RateLimitExceededException:
-                logging.error("Rate limit exceeded. Sleeping for 60 seconds.")
-                time.sleep(60)
-                continue  # Retry after sleeping
-            except Exception as e:
-                logging.error(f"Failed to fetch issue or files for PR #{pr.number}: {e}")
+                    last_handled = last_pr_number
+                    unrecorded += len(pr_entries)
+                    if unrecorded >= PROGRESS_INTERVAL:
+                        file.flush()
+                        _write_progress(progress_file, last_handled)
+                        unrecorded = 0
+
+            # Results are written from this thread only, so the output file needs no lock.
+            # One record per pull request so the file can be streamed back.
+            with open(output_file, "ab", buffering=1 << 20) as file:
+                dump_pull_requests(completed_entries(file), file, output_file)
+        if failed:
+            if last_handled is not None:
+                _write_progress(progress_file, last_handled)
+            logging.warning(f"Some PRs of {repo} failed, rerun with --no-overwrite to retry them")
+        else:
+            progress_file.unlink(missing_ok=True)
+    finally:
+        monitor.stop()
+        issue_executor.shutdown()
+        session.close()
 
     logging.info(f"Scrape completed for repo: {repo}")
 
 
-def analyze_repo(repo: str, token: str, output_file: str, overwrite: bool = True) -> None:
+def _find_raw_data(repo_dir: Path) -> Path:
+    """
+    Find the scraped data file of a repository, in any of the formats scrape writes.
+
+    :param repo_dir: Directory of the repository.
+    :return: Path to the data file, or to the default one if there is none.
+    :raises ValueError: If there are data files in several formats.
+    """
+    data_paths = [repo_dir / filename for filename in RAW_DATA_FILENAMES if (repo_dir / filename).exists()]
+    if len(data_paths) > 1:
+        names = ", ".join(data_path.name for data_path in data_paths)
+        raise ValueError(f"Several scraped data files in {repo_dir}: {names}. Pick one with --input-file.")
+    return data_paths[0] if data_paths else repo_dir / RAW_DATA_FILENAME
+
+
+# Per-process state of the analyze workers, set up by _init_analyze_worker
+_worker = {}
+
+
+def _init_analyze_worker(token: str, tmp_dir: Path, obo_cache_dir: Path) -> None:
+    """
+    Set up an analyze worker process.
+
+    :param token: GitHub token.
+    :param tmp_dir: Directory for temporary files, in which the worker gets a private directory.
+    :param obo_cache_dir: Directory of the OBO resources, downloaded or converted from OWL, kept across runs.
+    """
+    # No HTTP cache is installed, as workers only download raw files, which are never cached
+    _worker["token"] = token
+    _worker["tmp_dir"] = Path(tempfile.mkdtemp(dir=tmp_dir))
+    _worker["obo_cache_dir"] = obo_cache_dir
+    # Loads the new and old file of each PR on a pair of threads, over kept-alive connections
+    _worker["loader"] = ThreadPoolExecutor(max_workers=2)
+    _worker["session"] = get_session(token, pool_size=2)
+    # The only adapter cache, bounding the parsed ontologies a worker holds to ADAPTER_CACHE_SIZE. Maps the
+    # SHA-256 of a resource to its adapter, or None if it is not a valid ontology, and the URLs it was loaded
+    # from, least recently used first.
+    _worker["adapters"] = OrderedDict()
+    _worker["adapters_lock"] = threading.Lock()
+    # A single writer per process, as each writer stays registered with atexit
+    _worker["writer"] = StreamingKGCLWriter()
+
+
+def _cached_adapter(url: str = None, digest: str = None):
+    """
+    Look up an adapter in the worker's cache, by the URL it was loaded from or the digest of its resource.
+
+    :return: Tuple of whether it was found and the adapter.
+    """
+    adapters = _worker["adapters"]
+    with _worker["adapters_lock"]:
+        for cached_digest, (adapter, urls) in adapters.items():
+            if cached_digest == digest or url in urls:
+                urls.add(url)
+                adapters.move_to_end(cached_digest)
+                return True, adapter
+    return False, None
+
+
+def _cache_adapter(url: str, digest: str, adapter):
+    """Add an adapter to the worker's cache, evicting the least recently used one beyond ADAPTER_CACHE_SIZE."""
+    adapters = _worker["adapters"]
+    with _worker["adapters_lock"]:
+        adapters[digest] = (adapter, adapters.get(digest, (None, set()))[1] | {url})
+        adapters.move_to_end(digest)
+        if len(adapters) > ADAPTER_CACHE_SIZE:
+            adapters.popitem(last=False)
+    return adapter
+
+
+def _load_adapter(url: str):
+    """Download the resource at a raw GitHub URL and load it, or return None if it is not a valid ontology."""
+    found, adapter = _cached_adapter(url=url)
+    if found:
+        return adapter
+    extension = url.split(".")[-1]
+    sha = commit_sha_from_url(url)
+    file_path = _worker["tmp_dir"] / f"{sha}.{extension}"
+    obo_file_path = file_path.with_suffix(".obo")
+    # The resource of a commit never changes, so it is kept across runs as OBO, sparing both the download
+    # and, for OWL, ROBOT, which takes far longer than the diff itself
+    cached_path = _worker["obo_cache_dir"] / f"{sha}.obo"
+    try:
+        # Marked as recently used, so the cache is pruned of others first
+        utime(cached_path)
+        digest = file_digest(cached_path)
+        found, adapter = _cached_adapter(url=url, digest=digest)
+        if found:
+            return adapter
+        return _cache_adapter(url, digest, get_adapter(f"simpleobo:{cached_path}"))
+    except FileNotFoundError:
+        pass  # Not cached, or pruned in the meantime
+    try:
+        # Import lines of OWL files are dropped while downloading, sparing ROBOT's input a rewrite
+        download_file(
+            url,
+            file_path,
+            _worker["token"],
+            session=_worker["session"],
+            skip_lines_starting_with=b"Import" if extension == "owl" else None,
+        )
+        # The resource is often unchanged between the commits of different PRs, so reuse the adapter
+        # loaded for the same content under another commit
+        digest = file_digest(file_path)
+        found, adapter = _cached_adapter(url=url, digest=digest)
+        if found:
+            return adapter
+        if extension == "owl" and owl2obo(file_path, remove_imports=False) == 0:
+            return _cache_adapter(url, digest, None)
+        # Loaded before it is cached, as the cache may be pruned of it at any time
+        adapter = get_adapter(f"simpleobo:{obo_file_path}")
+        # Moved in under a name of its own first, so other workers never load a partly written file
+        partial_path = cached_path.with_name(f"{sha}.{getpid()}.part")
+        shutil.move(obo_file_path, partial_path)
+        replace(partial_path, cached_path)
+        return _cache_adapter(url, digest, adapter)
+    finally:
+        # The adapter holds the parsed ontology, so the files are no longer needed
+        file_path.unlink(missing_ok=True)
+        obo_file_path.unlink(missing_ok=True)
+
+
+def _analyze_pr(dictionary: dict) -> Optional[Path]:
+    """
+    Diff the resource of a pull request against the main branch, in an analyze worker process.
+
+    :param dictionary: Pull request data.
+    :return: Path to a file with the KGCL change lines as YAML sequence items, or None if there are no changes
+        or either version could not be loaded.
+    """
+    url_in_pr = dictionary[PR_CHANGED_FILES_KEY][0][URL_IN_PR_KEY]
+    url_on_main = dictionary[PR_CHANGED_FILES_KEY][0][URL_IN_MAIN_KEY]
+
+    # Load both versions concurrently
+    try:
+        adapter_new, adapter_old = _worker["loader"].map(_load_adapter, (url_in_pr, url_on_main))
+    except (ValueError, FileNotFoundError) as e:
+        logging.error(f"ValueError: {e}")
+        return None  # Skip this file and move to the next iteration
+    except Exception as e:
+        raise e
+        # logging.error(f"Error: {e}")
+        # return None  # Skip this file and move to the next iteration
+    if adapter_new is None or adapter_old is None:
+        return None
+
+    # Stream the changes to a file rather than holding them in memory, already rendered as YAML sequence
+    # items so the escaping is spread over the workers
+    changes_path = _worker["tmp_dir"] / f"{dictionary[PR_NUMBER_KEY]}.yaml"
+    writer = _worker["writer"]
+    with open(changes_path, "w", buffering=1 << 20) as changes_file:
+        writer.file = LinePrefixWriter(changes_file, CHANGE_PREFIX)
+        for change in adapter_old.diff(adapter_new):
+            writer.emit(change)
+        writer.file.flush()
+    if writer.file.lines_written == 0:
+        changes_path.unlink()
+        return None
+    return changes_path
+
+
+def _analyze_prs(dictionaries: List[dict]) -> List[Optional[Path]]:
+    """Diff a chunk of consecutive pull requests in an analyze worker process, see :func:`_analyze_pr`."""
+    return [_analyze_pr(dictionary) for dictionary in dictionaries]
+
+
+def analyze_repo(
+    repo: str,
+    token: str,
+    output_file: str,
+    overwrite: bool = True,
+    workers: int = 1,
+    obo_cache_size: int = OBO_CACHE_SIZE,
+    input_file: Optional[str] = None,
+) -> None:
     """
     Structure the pull request data and analyze the changes in the ontology files.
 
     :param repo: Org/name of the GitHub repo.
     :param output_file: Path to the output YAML file.
+    :param workers: Number of processes diffing pull requests concurrently. Each holds up to
+        ``ADAPTER_CACHE_SIZE`` parsed ontologies in memory.
+    :param obo_cache_size: Maximum size in bytes of the OBO resources kept across runs in the repository's
+        cache directory, least recently used ones being removed first. 0 keeps none.
+    :param input_file: Path to the scraped data file, in any format scrape writes. Defaults to the
+        ``raw_data`` file in the repository's directory.
     """
-    g = Github(token)
-    DATA_PATH = PROJECT_DIR / f"{repo.replace('/', '_')}/{RAW_DATA_FILENAME}"
-    TMP_DIR = PROJECT_DIR / f"{repo.replace('/', '_')}" / TMP_DIR_NAME
-    makedirs(TMP_DIR, exist_ok=True)
-    with open(DATA_PATH, "r") as file:
-        data = yaml.safe_load(file)
+    repo_slug = _repo_slug(repo)
+    repo_dir = PROJECT_DIR / repo_slug
+    DATA_PATH = Path(input_file) if input_file else _find_raw_data(repo_dir)
+    OBO_CACHE_DIR = repo_dir / OBO_CACHE_DIR_NAME
+    makedirs(OBO_CACHE_DIR, exist_ok=True)
+    prune_cache(OBO_CACHE_DIR, obo_cache_size)
     logging.info(f"Analyzing data for repo: {repo}")
 
     if not output_file:
-        output_file = PROJECT_DIR / f"{repo.replace('/', '_')}/{DATA_WITH_CHANGES_FILENAME}"
+        output_file = repo_dir / DATA_WITH_CHANGES_FILENAME
 
     # Write metadata to the output file
     metadata = {
@@ -211,93 +791,71 @@ def analyze_repo(repo: str, token: str, output_file: str, overwrite: bool = True
         "github_url": f"https://github.com/{repo}",
     }
 
-    if output_file.exists():
-        if overwrite:
-            Path(output_file).unlink()
-            mode = "w"
-            first_change_found = False
-        else:
-            pr_numbers_scraped = {int(pr[PR_NUMBER_KEY].strip("pr")) for pr in data[PULL_REQUESTS_KEY]}
-            with open(output_file, "r") as of:
-                analyzed_data = yaml.safe_load(of)
-            pr_numbers_analyzed = {int(pr[PR_NUMBER_KEY].strip("pr")) for pr in analyzed_data[PULL_REQUESTS_KEY]}
-            if pr_numbers_scraped == pr_numbers_analyzed:
-                logging.info(f"All data already analyzed for repo: {repo}")
-                return
-            pr_remaining = pr_numbers_scraped - pr_numbers_analyzed
-            mode = "a"
-            first_change_found = True
-    else:
+    output_file = Path(output_file)
+    pr_remaining = None
+    if output_file.exists() and not overwrite:
+        pr_numbers_scraped = _pr_numbers(DATA_PATH)
+        pr_numbers_analyzed = _pr_numbers(output_file)
+        if pr_numbers_scraped == pr_numbers_analyzed:
+            logging.info(f"All data already analyzed for repo: {repo}")
+            return
+        pr_remaining = pr_numbers_scraped - pr_numbers_analyzed
         mode = "a"
-        first_change_found = True
-
-    # Analyze data
-    with open(output_file, mode) as of:
-        if overwrite:
-            yaml.dump(metadata, of)
-            list_of_dicts = data[PULL_REQUESTS_KEY]
-        else:
-            list_of_dicts = [d for d in data[PULL_REQUESTS_KEY] if int(d[PR_NUMBER_KEY].strip("pr")) in pr_remaining]
-
-        for dictionary in list_of_dicts:
-            url_in_pr = dictionary[PR_CHANGED_FILES_KEY][0][URL_IN_PR_KEY]
-            url_on_main = dictionary[PR_CHANGED_FILES_KEY][0][URL_IN_MAIN_KEY]
-            extension = url_in_pr.split(".")[-1]
-
-            new_file_path = TMP_DIR / f"new.{extension}"
-            old_file_path = TMP_DIR / f"old.{extension}"
-
-            # Download the files
-            # 1. Download the file from the PR and name it new.obo/new.owl
-            download_file(url_in_pr, new_file_path, g, token)
-
-            # 2. Download the file from the main branch and name it old.obo/old.owl
-            download_file(url_on_main, old_file_path, g, token)
-
-            # 3. Run the diff command
-            if extension == "owl":
-                n = owl2obo(new_file_path)
-                o = owl2obo(old_file_path)
-                if n == 0 or o == 0:
-                    continue
-                old_file_path = old_file_path.with_suffix(".obo")
-                new_file_path = new_file_path.with_suffix(".obo")
-            try:
-                adapter_new = get_adapter(f"simpleobo:{new_file_path}")
-                adapter_old = get_adapter(f"simpleobo:{old_file_path}")
-            except (ValueError, FileNotFoundError) as e:
-                logging.error(f"ValueError: {e}")
-                continue  # Skip this file and move to the next iteration
-            except Exception as e:
-                raise e
-                # logging.error(f"Error: {e}")
-                # continue  # Skip this file and move to the next iteration
-
-            all_changes = []
-
-            # Create an in-memory file-like object and use it within a 'with' statement
-            with io.StringIO() as output:
-                # Instantiate StreamingKGCLWriter with the in-memory file-like object
-                writer = StreamingKGCLWriter(ontology_interface=adapter_old, file=output)
-
-                # Emit all changes
-                for change in adapter_old.diff(adapter_new):
-                    writer.emit(change)
-
-                # Capture the content written to the in-memory file-like object
-                all_changes = output.getvalue().splitlines()
-            # Create a new YAML file with the changes
-            output_dict = {key: value for key, value in dictionary.items() if key != PR_CHANGED_FILES_KEY}
-            output_dict[CHANGES_KEY] = all_changes
-            if len(output_dict[CHANGES_KEY]) > 0:
-                if not first_change_found:
-                    yaml.dump({PULL_REQUESTS_KEY: [output_dict]}, of, sort_keys=False)
-                    first_change_found = True
-                else:
-                    yaml.dump([output_dict], of, default_flow_style=False, indent=2, sort_keys=False)
-
-            # delete new and old files
-            shutil.rmtree(TMP_DIR)
-            makedirs(TMP_DIR, exist_ok=True)
+        first_change_found = bool(pr_numbers_analyzed)
+    else:
+        mode = "w"
+        first_change_found = False
+
+    # The scraped data is streamed, so only the PRs queued on the workers are held in memory
+    entries = (
+        dictionary
+        for dictionary in iter_pull_requests(DATA_PATH)
+        if pr_remaining is None or int(dictionary[PR_NUMBER_KEY].strip("pr")) in pr_remaining
+    )
+
+    # Created only now, and removed whatever happens, as on a RAM disk the downloaded ontologies it holds
+    # would take up memory until reboot
+    TMP_DIR = scratch_dir(f"ontodiff_{repo_slug}_", repo_dir / TMP_DIR_NAME)
+    makedirs(TMP_DIR, exist_ok=True)
+    try:
+        # Diff the PRs on a pool of processes, writing the output from this process only. Consecutive PRs go to
+        # the same worker, so the adapters it caches are reused as PRs often share a commit.
+        with open(output_file, mode, buffering=1 << 20) as of, ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_analyze_worker,
+            initargs=(token, TMP_DIR, OBO_CACHE_DIR),
+        ) as executor:
+            if pr_remaining is None:
+                yaml.dump(metadata, of, Dumper=SafeDumper)
+
+            chunks = _batched(entries, ANALYZE_CHUNK_SIZE)
+            pending = deque(
+                (chunk, executor.submit(_analyze_prs, chunk))
+                for chunk in islice(chunks, workers * ANALYZE_CHUNKS_PER_WORKER)
+            )
+            while pending:
+                chunk, future = pending.popleft()
+                changes_paths = iter(future.result())
+                # Keep the workers busy while this chunk is written
+                for next_chunk in islice(chunks, 1):
+                    pending.append((next_chunk, executor.submit(_analyze_prs, next_chunk)))
+                for dictionary in chunk:
+                    changes_path = next(changes_paths)
+                    if changes_path is None:
+                        continue
 
+                    # Copy the changes straight into the output YAML file
+                    if not first_change_found:
+                        of.write(f"{PULL_REQUESTS_KEY}:\n")
+                        first_change_found = True
+                    output_dict = {key: value for key, value in dictionary.items() if key != PR_CHANGED_FILES_KEY}
+                    of.write(changes_header(output_dict))
+                    with open(changes_path, "r") as changes_file:
+                        shutil.copyfileobj(changes_file, of, 1 << 20)
+                    changes_path.unlink()
+                # Pruned from this process only, once per chunk. A worker loading a pruned file fetches it again.
+                prune_cache(OBO_CACHE_DIR, obo_cache_size)
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
     logging.info(f"Analysis completed for repo: {repo}")
@@ -1,31 +1,329 @@
 """Utility functions for the OntoDiff Curator."""
 
+import hashlib
+import json
 import logging
+import os
 import shlex
+import shutil
 import subprocess
+import tempfile
+import threading
 import time
+from collections import defaultdict
 from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Union
+from urllib.parse import urlsplit
 
+import msgpack
 import requests
+import requests_cache
+import yaml
+from github import Github, GithubRetry
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ontodiff_curator.constants import PULL_REQUESTS_KEY
+
+try:
+    # libyaml's emitter and parser, several times faster than the pure Python ones
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper, SafeLoader
 
 RETRY_DELAY = 300  # 5 minutes
+GITHUB_PER_PAGE = 100  # Maximum page size of the GitHub REST API
+GITHUB_TIMEOUT = 30  # seconds
+CACHE_NAME = "github_cache"
+CACHE_BACKENDS = ("sqlite", "memory", "redis")
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # bytes
+RATE_LIMIT_POLL_INTERVAL = 30  # seconds
+RAM_DISK_DIR = Path("/dev/shm")  # noqa: S108 - only used through tempfile.mkdtemp
+RAM_DISK_MIN_FREE = 2 << 30  # 2 GiB
 PROJECT_DIR = Path(__file__).parents[2]
+MSGPACK_SUFFIX = ".msgpack"
+JSON_LINES_SUFFIX = ".jsonl"
+
+
+def install_cache(backend: str = "sqlite") -> None:
+    """
+    Install the HTTP cache for GitHub requests.
+
+    ``sqlite`` persists responses between runs and uses WAL mode so concurrent readers do not
+    block on the writer, ``memory`` avoids file locking altogether for a single run and
+    ``redis`` can be shared between processes.
+
+    Responses follow GitHub's ``Cache-Control`` headers, and stale ones are revalidated with their
+    ``ETag``, so repeated runs get ``304 Not Modified`` responses that do not count against the rate limit.
+
+    :param backend: Name of the requests-cache backend.
+    """
+    kwargs = {}
+    if backend == "sqlite":
+        kwargs["wal"] = True
+    requests_cache.install_cache(
+        CACHE_NAME,
+        backend=backend,
+        cache_control=True,
+        expire_after=requests_cache.NEVER_EXPIRE,
+        filter_fn=_is_cacheable,
+        **kwargs,
+    )
+
+
+def _is_cacheable(response: requests.Response) -> bool:
+    """
+    Tell whether a response may be stored in the HTTP cache.
+
+    The rate limit must always be read live. Ontology files are never cached: caching reads the whole body
+    into memory before it is streamed to disk, and each commit's file is downloaded once anyway. Raw URLs on
+    github.com redirect to raw.githubusercontent.com, so both are excluded. A filter is used rather than
+    ``urls_expire_after`` rules, as ``Cache-Control`` headers, such as the ``max-age`` of raw files,
+    override those.
+
+    :param response: Response received.
+    :return: Whether the response may be cached.
+    """
+    url = urlsplit(response.url)
+    if url.hostname == "raw.githubusercontent.com":
+        return False
+    if url.hostname == "github.com":
+        return "/raw/" not in url.path
+    return not (url.hostname == "api.github.com" and url.path == "/rate_limit")
+
+
+def get_github(token: str, pool_size: int = None) -> Github:
+    """
+    Create a GitHub client that pages with the largest page size and retries transient failures.
 
+    :param token: GitHub token.
+    :param pool_size: Number of pooled connections, for clients shared between threads.
+    :return: GitHub instance.
+    """
+    return Github(
+        token,
+        per_page=GITHUB_PER_PAGE,
+        timeout=GITHUB_TIMEOUT,
+        retry=GithubRetry(total=5, backoff_factor=0.3),
+        pool_size=pool_size,
+    )
 
-def check_rate_limit(g):
+
+def get_session(token: str, pool_size: int) -> requests.Session:
+    """
+    Create an HTTP session for GitHub that keeps connections alive and retries transient failures.
+
+    :param token: GitHub token, sent with every request.
+    :param pool_size: Number of pooled connections, for sessions shared between threads.
+    :return: Session.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(502, 503, 504))
+    session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+    session.headers["Authorization"] = f"token {token}"
+    return session
+
+
+def _iter_pages(
+    session: requests.Session, url: str, params: dict, monitor: "RateLimitMonitor" = None
+) -> Iterator[dict]:
+    """
+    Iterate over the items of a paginated REST API listing, 100 per request.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param url: URL of the listing.
+    :param params: Query parameters of the first page.
+    :param monitor: Rate limit monitor gating each request, if any.
+    :return: Iterator over the items.
+    """
+    params = {"per_page": GITHUB_PER_PAGE, **params}
+    while url:
+        if monitor is not None:
+            monitor.wait()
+        response = session.get(url, params=params, timeout=GITHUB_TIMEOUT)
+        response.raise_for_status()
+        yield from response.json()
+        # The next page URL carries the query parameters
+        url = response.links.get("next", {}).get("url")
+        params = None
+
+
+def list_review_comments(
+    session: requests.Session, repo: str, monitor: "RateLimitMonitor" = None
+) -> Dict[int, List[str]]:
+    """
+    List the review comments of all pull requests in a repository, with one request per 100 comments.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :param monitor: Rate limit monitor gating each request, if any.
+    :return: Comment bodies by pull request number, oldest first.
+    """
+    comments = defaultdict(list)
+    url = f"https://api.github.com/repos/{repo}/pulls/comments"
+    for comment in _iter_pages(session, url, {"sort": "created", "direction": "asc"}, monitor):
+        comments[int(comment["pull_request_url"].rsplit("/", 1)[1])].append(comment["body"])
+    return dict(comments)
+
+
+def list_issue_comments(
+    session: requests.Session, repo: str, monitor: "RateLimitMonitor" = None
+) -> Dict[int, List[str]]:
+    """
+    List the comments of all issues and pull requests in a repository, with one request per 100 comments.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :param monitor: Rate limit monitor gating each request, if any.
+    :return: Comment bodies by issue number, oldest first.
+    """
+    comments = defaultdict(list)
+    url = f"https://api.github.com/repos/{repo}/issues/comments"
+    for comment in _iter_pages(session, url, {"sort": "created", "direction": "asc"}, monitor):
+        comments[int(comment["issue_url"].rsplit("/", 1)[1])].append(comment["body"])
+    return dict(comments)
+
+
+def iter_issues(session: requests.Session, repo: str, monitor: "RateLimitMonitor" = None) -> Iterator[dict]:
+    """
+    Iterate over all issues of a repository, open and closed, with one request per 100 issues.
+
+    Pull requests are listed as well, with a ``pull_request`` member.
+
+    :param session: HTTP session carrying the GitHub token.
+    :param repo: Org/name of the GitHub repo.
+    :param monitor: Rate limit monitor gating each request, if any.
+    :return: Iterator over the issues as returned by the REST API.
+    """
+    return _iter_pages(session, f"https://api.github.com/repos/{repo}/issues", {"state": "all"}, monitor)
+
+
+def check_rate_limit(g, resource: str = "core"):
     """
     Check the current rate limit status of the GitHub API.
 
     :param g: GitHub instance.
+    :param resource: Rate limit resource to check, "core" for the REST API or "graphql".
     :return: Tuple containing remaining requests, reset timestamp, and current timestamp.
     """
-    rate_limit = g.get_rate_limit().core
+    rate_limit = getattr(g.get_rate_limit(), resource)
     remaining = rate_limit.remaining
     reset_timestamp = rate_limit.reset.timestamp()
     current_timestamp = time.time()
     return remaining, reset_timestamp, current_timestamp
 
 
+def pacing_delay(remaining: int, reset_timestamp: float, current_timestamp: float) -> float:
+    """
+    Compute the delay between requests that spreads the remaining requests evenly until the rate limit resets.
+
+    :param remaining: Number of remaining requests.
+    :param reset_timestamp: Timestamp at which the rate limit resets.
+    :param current_timestamp: Current timestamp.
+    :return: Delay in seconds.
+    """
+    return max(0.0, (reset_timestamp - current_timestamp) / max(1, remaining))
+
+
+class RateLimitMonitor(threading.Thread):
+    """
+    Background thread that paces worker threads and pauses them when the GitHub rate limit runs low.
+
+    Workers call :meth:`wait` before issuing requests. Slots are handed out from a token bucket
+    holding the slots the remaining requests above the threshold allow, given the requests used
+    per slot since the check before. Workers run unpaced while it holds any, and are spaced so the
+    remaining requests last until the rate limit resets once it is empty. :meth:`wait` also blocks
+    while the monitor is sleeping until the rate limit resets.
+    """
+
+    def __init__(self, g, threshold: int, interval: float = RATE_LIMIT_POLL_INTERVAL, resource: str = "core"):
+        """
+        Initialize the monitor.
+
+        :param g: GitHub instance.
+        :param threshold: Pause workers when fewer than this many requests remain.
+        :param interval: Seconds between rate limit checks.
+        :param resource: Rate limit resource to watch, "core" for the REST API or "graphql".
+        """
+        super().__init__(daemon=True)
+        self.g = g
+        self.threshold = threshold
+        self.resource = resource
+        self.interval = interval
+        self._resume = threading.Event()
+        self._resume.set()
+        self._stopped = threading.Event()
+        # Unpaced until the first check
+        self._delay = 0.0
+        self._capacity = float("inf")
+        self._tokens = float("inf")
+        self._refilled = time.monotonic()
+        self._slot_lock = threading.Lock()
+        # Requests used per slot, measured between checks, as a slot usually covers several requests
+        self._cost = 1.0
+        self._slots = 0
+        self._last_check = None
+
+    def run(self):
+        """Poll the rate limit until stopped."""
+        while not self._stopped.is_set():
+            try:
+                remaining, reset_timestamp, current_timestamp = check_rate_limit(self.g, self.resource)
+            except Exception as e:
+                logging.warning(f"Could not check rate limit: {e}")
+                self._stopped.wait(self.interval)
+                continue
+            self._update(remaining, reset_timestamp, current_timestamp)
+            if remaining < self.threshold:
+                sleep_time = max(0, reset_timestamp - current_timestamp + 10)  # Add buffer time
+                logging.info(f"Rate limit low. Pausing workers for {sleep_time} seconds.")
+                self._resume.clear()
+                self._stopped.wait(sleep_time)
+                self._resume.set()
+            else:
+                self._stopped.wait(self.interval)
+
+    def _update(self, remaining: int, reset_timestamp: float, current_timestamp: float):
+        """
+        Refill the bucket from a rate limit check.
+
+        :param remaining: Number of remaining requests.
+        :param reset_timestamp: Timestamp at which the rate limit resets.
+        :param current_timestamp: Current timestamp.
+        """
+        with self._slot_lock:
+            slots, self._slots = self._slots, 0
+            if slots and self._last_check is not None and self._last_check[1] == reset_timestamp:
+                self._cost = max(1.0, (self._last_check[0] - remaining) / slots)
+            self._last_check = (remaining, reset_timestamp)
+            self._delay = pacing_delay(remaining, reset_timestamp, current_timestamp) * self._cost
+            self._capacity = max(0.0, remaining - self.threshold) / self._cost
+            # Slots already promised to waiting workers stay taken
+            self._tokens = self._capacity + min(0.0, self._tokens)
+            self._refilled = time.monotonic()
+
+    def wait(self):
+        """Block until workers are allowed to proceed and the next request slot is due."""
+        self._resume.wait()
+        with self._slot_lock:
+            now = time.monotonic()
+            if self._delay:
+                self._tokens = min(self._capacity, self._tokens + (now - self._refilled) / self._delay)
+            else:
+                self._tokens = self._capacity
+            self._refilled = now
+            self._tokens -= 1
+            self._slots += 1
+            delay = max(0.0, -self._tokens * self._delay)
+        time.sleep(delay)
+
+    def stop(self):
+        """Stop the monitor and release any waiting workers."""
+        self._stopped.set()
+        self._resume.set()
+
+
 def remove_import_lines(owl_file: str):
     """
     Remove import lines from an OWL file.
@@ -35,15 +333,15 @@ def remove_import_lines(owl_file: str):
     :param owl_file: Path to the OWL file.
     """
     try:
-        # Read the content of the OWL file
-        with open(owl_file, "r") as file:
-            lines = file.readlines()
-
-        # Write back the lines excluding the specified import lines
-        with open(owl_file, "w") as file:
-            for line in lines:
-                if not line.startswith("Import"):
-                    file.write(line)
+        # Stream the lines excluding the specified import lines to a new file, then swap it in.
+        # The lines are compared as bytes, so they are never decoded.
+        with open(owl_file, "rb") as source, tempfile.NamedTemporaryFile(
+            "wb", dir=Path(owl_file).parent, delete=False
+        ) as target:
+            for line in source:
+                if not line.startswith(b"Import"):
+                    target.write(line)
+        os.replace(target.name, owl_file)
 
         logging.info(f"Successfully removed specified import lines from {owl_file}")
 
@@ -51,13 +349,15 @@ def remove_import_lines(owl_file: str):
         logging.error(f"Error removing import lines from {owl_file}: {e}")
 
 
-def owl2obo(owl_file: str):
+def owl2obo(owl_file: str, remove_imports: bool = True):
     """
     Convert OWL file to OBO format.
 
     :param owl_file: Path to the OWL file.
+    :param remove_imports: Remove the import lines first. Pass False if they were dropped when downloading.
     """
-    remove_import_lines(owl_file)
+    if remove_imports:
+        remove_import_lines(owl_file)
     obo_file = str(owl_file).replace(".owl", ".obo")
     catalog_file = PROJECT_DIR / "catalog-v001.xml"
     command = (
@@ -82,27 +382,195 @@ def owl2obo(owl_file: str):
         raise RuntimeError(f"Error converting OWL to OBO: {e}") from e
 
 
-def download_file(url, file_path, g, token):
-    """Download a file from a URL and save it to the specified path."""
+def download_file(url, file_path, token, session: requests.Session = None, skip_lines_starting_with: bytes = None):
+    """
+    Download a file from a URL and save it to the specified path.
+
+    Raw files are served outside the REST API and do not count against its rate limit, so the
+    download is not paced. They are also left out of the HTTP cache by :func:`install_cache`, so the
+    body is streamed to disk rather than read into memory. Pass a ``session`` to reuse its pooled
+    connections across downloads, and ``skip_lines_starting_with`` to drop lines while the file is
+    written rather than rewriting it afterwards.
+    """
+    http = session if session is not None else requests
     while True:
         try:
-            # Check rate limit and sleep if necessary
-            remaining, reset_timestamp, current_timestamp = check_rate_limit(g)
-            if remaining < 10:
-                sleep_time = max(0, reset_timestamp - current_timestamp + 10)  # Add buffer time
-                logging.info(f"Rate limit low. Sleeping for {sleep_time} seconds.")
-                time.sleep(sleep_time)
-            else:
-                time.sleep(0.72)  # Sleep to avoid hitting rate limit
-
-            response = requests.get(url, timeout=10, headers={"Authorization": f"token {token}"})
-            response.raise_for_status()  # Raise an HTTPError for bad responses
-            with open(file_path, "wb") as file:
-                file.write(response.content)
+            # Stream the body to disk rather than holding the whole ontology in memory
+            with http.get(url, timeout=10, headers={"Authorization": f"token {token}"}, stream=True) as response:
+                response.raise_for_status()  # Raise an HTTPError for bad responses
+                with open(file_path, "wb", buffering=DOWNLOAD_CHUNK_SIZE) as file:
+                    if skip_lines_starting_with is None:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            file.write(chunk)
+                    else:
+                        for line in response.iter_lines(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            if not line.startswith(skip_lines_starting_with):
+                                file.write(line + b"\n")
             break  # Exit the loop if download is successful
         except requests.exceptions.ReadTimeout:
             logging.warning(f"ReadTimeout occurred. Retrying in {RETRY_DELAY // 60} minutes...")
             time.sleep(RETRY_DELAY)
         except requests.exceptions.RequestException as e:
             logging.error(f"RequestException: {e}")
+            # A body cut short, which urllib3 detects against Content-Length, must not be parsed as the resource
+            Path(file_path).unlink(missing_ok=True)
             break  # Exit the loop on other request exceptions
+
+
+def file_digest(file_path: Union[Path, str]) -> str:
+    """
+    Compute the SHA-256 digest of a file, reading it in chunks.
+
+    :param file_path: Path to the file.
+    :return: Hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prune_cache(cache_dir: Union[Path, str], max_bytes: int, suffix: str = ".obo") -> None:
+    """
+    Remove the least recently used files from a cache directory until they fit in ``max_bytes``.
+
+    Files are ordered by modification time, so touch a file when it is used. Only files ending in ``suffix``
+    are counted and removed, leaving files still being written alone.
+
+    :param cache_dir: Cache directory.
+    :param max_bytes: Maximum total size of the cached files.
+    :param suffix: Suffix of the cached files.
+    """
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.name.endswith(suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        Path(path).unlink(missing_ok=True)
+        total -= size
+
+
+def commit_sha_from_url(url: str) -> str:
+    """
+    Get the commit SHA from a raw GitHub file URL.
+
+    :param url: URL of the form ``https://github.com/<org>/<repo>/raw/<sha>/<path>``.
+    :return: Commit SHA.
+    """
+    return url.split("/raw/", 1)[1].split("/", 1)[0]
+
+
+def scratch_dir(prefix: str, fallback: Path) -> Path:
+    """
+    Choose a directory for temporary ontology files, preferring a RAM-backed one.
+
+    Downloads and conversions in a RAM-backed directory never touch the disk, which matters
+    when the same multi-megabyte files are written and re-read for every pull request.
+
+    :param prefix: Prefix of the private directory created on the RAM disk.
+    :param fallback: Directory to use if no RAM disk with enough free space is available.
+    :return: Path to the directory.
+    """
+    if RAM_DISK_DIR.is_dir() and shutil.disk_usage(RAM_DISK_DIR).free >= RAM_DISK_MIN_FREE:
+        return Path(tempfile.mkdtemp(prefix=prefix, dir=RAM_DISK_DIR))
+    return fallback
+
+
+def iter_pull_requests(data_path: Union[Path, str]) -> Iterator[dict]:
+    """
+    Iterate over the pull requests stored in a scraped data file.
+
+    Files with a ``.msgpack`` suffix hold a stream of msgpack objects, one per pull request,
+    and files with a ``.jsonl`` suffix one JSON object per line.
+    Anything else is read as YAML, with each pull request stored as its own document.
+    YAML files written as a single document with a top-level ``pull_requests`` list are also supported.
+
+    :param data_path: Path to the scraped data file.
+    :return: Iterator over the pull request entries.
+    """
+    suffix = Path(data_path).suffix
+    if suffix == MSGPACK_SUFFIX:
+        with open(data_path, "rb") as file:
+            unpacker = msgpack.Unpacker(file, raw=False)
+            end = 0
+            for pr_entry in unpacker:
+                end = unpacker.tell()
+                yield pr_entry
+            # The unpacker silently stops at a record cut short, which would hide any records written after it
+            if end < os.fstat(file.fileno()).st_size:
+                raise ValueError(f"{data_path} ends with a partial record at byte {end}")
+        return
+    if suffix == JSON_LINES_SUFFIX:
+        with open(data_path, "rb") as file:
+            yield from map(json.loads, file)
+        return
+    with open(data_path, "r") as file:
+        for document in yaml.load_all(file, Loader=SafeLoader):
+            if not document:
+                continue
+            if PULL_REQUESTS_KEY in document:
+                yield from document[PULL_REQUESTS_KEY]
+            else:
+                yield document
+
+
+def truncate_partial_record(data_path: Union[Path, str]) -> None:
+    """
+    Remove the partial record an interrupted scrape may have left at the end of a msgpack or JSON Lines file.
+
+    Records appended after a partial one would otherwise be lost, or fail to load.
+    YAML files are left as they are.
+
+    :param data_path: Path to the scraped data file.
+    """
+    suffix = Path(data_path).suffix
+    with open(data_path, "r+b") as file:
+        size = os.fstat(file.fileno()).st_size
+        if suffix == MSGPACK_SUFFIX:
+            # Past a partial record the unpacker's position is not at a record boundary
+            unpacker = msgpack.Unpacker(file, raw=False)
+            end = 0
+            for _ in unpacker:
+                end = unpacker.tell()
+        elif suffix == JSON_LINES_SUFFIX:
+            end = 0
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+        else:
+            return
+        if end < size:
+            logging.warning(f"Removing a partial record of {size - end} bytes at the end of {data_path}")
+            file.truncate(end)
+
+
+def dump_pull_requests(pull_requests: Iterable[dict], file: BinaryIO, data_path: Union[Path, str]) -> None:
+    """
+    Write scraped pull requests in the format :func:`iter_pull_requests` reads back.
+
+    Each entry is written before the next one is taken from ``pull_requests``.
+
+    :param pull_requests: Pull request entries.
+    :param file: Binary file to write to.
+    :param data_path: Path of the data file, whose suffix selects the format.
+    """
+    suffix = Path(data_path).suffix
+    if suffix == MSGPACK_SUFFIX:
+        packer = msgpack.Packer(use_bin_type=True)
+        for pr_entry in pull_requests:
+            file.write(packer.pack(pr_entry))
+    elif suffix == JSON_LINES_SUFFIX:
+        for pr_entry in pull_requests:
+            file.write(json.dumps(pr_entry, ensure_ascii=False, separators=(",", ":")).encode() + b"\n")
+    else:
+        yaml.dump_all(pull_requests, file, Dumper=SafeDumper, explicit_start=True, sort_keys=False, encoding="utf-8")
@@ -0,0 +1,145 @@
+"""Fast YAML emitter for the fixed schema of the analyzed pull requests."""
+
+import io
+import json
+import re
+from typing import IO
+
+from yaml.nodes import ScalarNode
+from yaml.resolver import Resolver
+
+from ontodiff_curator.constants import CHANGES_KEY
+
+INDENT = 2
+# Sequence item prefix of the changes of a pull request
+CHANGE_PREFIX = f"{' ' * INDENT}- "
+STR_TAG = "tag:yaml.org,2002:str"
+
+# Plain scalars are printable ASCII and may not start with an indicator character or a space.
+_PLAIN_RE = re.compile(r"(?![-?:,\[\]{}#&*!|>'\"%@`])[\x21-\x7e][\x20-\x7e]*")
+# Anything outside printable ASCII is escaped inside double quotes, as PyYAML does by default.
+_NON_ASCII_RE = re.compile(r"[^\x20-\x7e]")
+_RESOLVER = Resolver()
+
+
+def _escape_char(match: re.Match) -> str:
+    """Escape a single character for a double-quoted scalar."""
+    code = ord(match.group())
+    if code <= 0xFF:
+        return f"\\x{code:02x}"
+    if code <= 0xFFFF:
+        return f"\\u{code:04x}"
+    return f"\\U{code:08x}"
+
+
+def _escape(value: str) -> str:
+    """
+    Render a string as a YAML scalar.
+
+    The string is emitted as a plain scalar when that is unambiguous, otherwise it is double-quoted.
+
+    :param value: String to render.
+    :return: YAML scalar.
+    """
+    if (
+        _PLAIN_RE.fullmatch(value)
+        and ": " not in value
+        and " #" not in value
+        and not value.endswith((" ", ":"))
+        and _RESOLVER.resolve(ScalarNode, value, (True, False)) == STR_TAG
+    ):
+        return value
+    return _NON_ASCII_RE.sub(_escape_char, json.dumps(value, ensure_ascii=False))
+
+
+def _scalar(value) -> str:
+    """Render a scalar value."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return _escape(value)
+    if value == []:
+        return "[]"
+    if value == {}:
+        return "{}"
+    raise TypeError(f"Cannot emit value of type {type(value).__name__}")
+
+
+def _write_mapping(mapping: dict, indent: int, out: IO[str], first_prefix: str = None) -> None:
+    """Write a block mapping, optionally starting on a sequence item line."""
+    pad = " " * indent
+    for i, (key, value) in enumerate(mapping.items()):
+        head = f"{first_prefix if i == 0 and first_prefix is not None else pad}{key}:"
+        if isinstance(value, dict) and value:
+            out.write(f"{head}\n")
+            _write_mapping(value, indent + INDENT, out)
+        elif isinstance(value, list) and value:
+            out.write(f"{head}\n")
+            _write_sequence(value, indent, out)
+        else:
+            out.write(f"{head} {_scalar(value)}\n")
+
+
+def _write_sequence(items: list, indent: int, out: IO[str]) -> None:
+    """Write a block sequence."""
+    pad = " " * indent
+    for item in items:
+        if isinstance(item, dict) and item:
+            _write_mapping(item, indent + INDENT, out, first_prefix=f"{pad}- ")
+        else:
+            out.write(f"{pad}- {_scalar(item)}\n")
+
+
+class LinePrefixWriter:
+    """Text stream that writes every line it receives as an item of a YAML block sequence."""
+
+    def __init__(self, out: IO[str], prefix: str):
+        """
+        Initialize the writer.
+
+        :param out: Text stream to write to.
+        :param prefix: Sequence item prefix, including its indentation.
+        """
+        self.out = out
+        self.prefix = prefix
+        self.lines_written = 0
+        self._partial = ""
+
+    def write(self, text: str) -> int:
+        """Write the complete lines in ``text`` and keep any trailing partial line."""
+        *lines, self._partial = (self._partial + text).split("\n")
+        for line in lines:
+            self.out.write(f"{self.prefix}{_escape(line)}\n")
+            self.lines_written += 1
+        return len(text)
+
+    def flush(self) -> None:
+        """Write any trailing partial line."""
+        if self._partial:
+            self.write("\n")
+
+
+def format_pr(pr_entry: dict) -> str:
+    """
+    Render a pull request, without its changes, as an item of the top-level ``pull_requests`` sequence.
+
+    :param pr_entry: Pull request data.
+    :return: YAML text.
+    """
+    buffer = io.StringIO()
+    _write_mapping(pr_entry, INDENT, buffer, first_prefix="- ")
+    return buffer.getvalue()
+
+
+def changes_header(pr_entry: dict) -> str:
+    """
+    Render a pull request, up to the key of its changes, as an item of the top-level ``pull_requests`` sequence.
+
+    :param pr_entry: Pull request data without the changes.
+    :return: YAML text, to be followed by lines written with :data:`CHANGE_PREFIX`.
+    """
+    return f"{format_pr(pr_entry)}{' ' * INDENT}{CHANGES_KEY}:\n"
@@ -0,0 +1,59 @@
+"""Tests for the GitHub GraphQL queries."""
+
+import unittest
+from unittest import mock
+
+from ontodiff_curator.github_graphql import _changed_paths
+
+VARIABLES = {"owner": "pato-ontology", "name": "pato", "number": 571}
+
+
+def _files(paths, end_cursor=None):
+    """Build a page of the ``files`` connection."""
+    return {
+        "nodes": [{"path": path} for path in paths],
+        "pageInfo": {"hasNextPage": bool(end_cursor), "endCursor": end_cursor},
+    }
+
+
+def _session(*pages):
+    """Mock a session answering the files query with the given pages, in order."""
+    responses = [
+        mock.Mock(json=mock.Mock(return_value={"data": {"repository": {"pullRequest": {"files": page}}}}))
+        for page in pages
+    ]
+    return mock.Mock(post=mock.Mock(side_effect=responses))
+
+
+class TestChangedPaths(unittest.TestCase):
+    """Test paging through the changed files of a pull request."""
+
+    def test_all_pages(self):
+        """Without a suffix every page is fetched, each from the cursor of the one before."""
+        session = _session(_files(["c"], end_cursor="2"), _files(["d"]))
+        paths = _changed_paths(session, VARIABLES, _files(["a", "b"], end_cursor="1"))
+        self.assertEqual(paths, ["a", "b", "c", "d"])
+        cursors = [call.kwargs["json"]["variables"]["cursor"] for call in session.post.call_args_list]
+        self.assertEqual(cursors, ["1", "2"])
+
+    def test_suffix_on_later_page(self):
+        """Paging stops at the page with the first path ending with the suffix."""
+        session = _session(_files(["README.md", "src/ontology/pato-edit.obo"], end_cursor="2"))
+        paths = _changed_paths(session, VARIABLES, _files(["a"], end_cursor="1"), path_suffix="/pato-edit.obo")
+        self.assertEqual(paths, ["src/ontology/pato-edit.obo"])
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_suffix_on_first_page(self):
+        """No further page is fetched once the suffix is found."""
+        session = _session()
+        first_page = _files(["src/ontology/pato-edit.obo"], end_cursor="1")
+        self.assertEqual(
+            _changed_paths(session, VARIABLES, first_page, path_suffix="/pato-edit.obo"),
+            [first_page["nodes"][0]["path"]],
+        )
+        session.post.assert_not_called()
+
+    def test_suffix_missing(self):
+        """A pull request not changing the resource has no paths."""
+        session = _session(_files(["b"]))
+        self.assertEqual(_changed_paths(session, VARIABLES, _files(["a"], end_cursor="1"), path_suffix="/x.obo"), [])
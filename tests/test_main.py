@@ -0,0 +1,381 @@
+"""Tests for the scrape and analyze helpers."""
+
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from ontodiff_curator import main
+from ontodiff_curator.constants import (
+    ISSUE_NUMBER_KEY,
+    PR_CHANGED_FILES_KEY,
+    PR_CLOSED_ISSUES_KEY,
+    PR_COMMENTS_KEY,
+    PR_NUMBER_KEY,
+    PULL_REQUESTS_KEY,
+    URL_IN_MAIN_KEY,
+    URL_IN_PR_KEY,
+)
+from ontodiff_curator.main import (
+    _ISSUE_RE,
+    ADAPTER_CACHE_SIZE,
+    PREFETCH_MIN_PRS,
+    _filter_pull_requests,
+    _find_raw_data,
+    _get_issue_data,
+    _graphql_pr_entry,
+    _load_adapter,
+    _pr_numbers,
+    _progress_file,
+    _read_progress,
+    _resume_max_pr_number,
+    _spans_many_prs,
+    _write_progress,
+    analyze_repo,
+)
+
+
+def _issue(number, pull_request=None):
+    """Mock a PyGithub issue."""
+    comment = mock.Mock(body=f"Comment on #{number}")
+    return mock.Mock(
+        number=number,
+        title=f"Issue {number}",
+        body="Body",
+        labels=[],
+        pull_request=pull_request,
+        get_comments=mock.Mock(return_value=[comment]),
+    )
+
+
+def _graphql_node(merged=True, files=("src/ontology/pato-edit.obo",), issue_numbers=(263,)):
+    """Mock a ``pullRequest`` node as returned by :func:`fetch_pull_requests`."""
+    return {
+        "number": 571,
+        "title": "Expand ORCIDs",
+        "body": "Fixes #263",
+        "merged": merged,
+        "baseRefOid": "base",
+        "headRefOid": "head",
+        "labels": {"nodes": [{"name": "bug"}]},
+        "reviewThreads": {
+            "nodes": [
+                {"comments": {"nodes": [{"body": "first"}, {"body": "reply"}]}},
+                {"comments": {"nodes": [{"body": "second"}]}},
+            ]
+        },
+        "files": list(files),
+        "closingIssuesReferences": {
+            "nodes": [
+                {
+                    "number": number,
+                    "title": "Standardise orcids",
+                    "body": None,
+                    "labels": {"nodes": []},
+                    "comments": {"nodes": [{"body": "done"}]},
+                }
+                for number in issue_numbers
+            ]
+        },
+    }
+
+
+class TestIssueReferences(unittest.TestCase):
+    """Test finding the issues referenced in a PR body."""
+
+    def test_references(self):
+        """Plain references are found wherever they stand."""
+        body = "Fixes #12, closes:#34 (see #56).\n#78"
+        self.assertEqual(_ISSUE_RE.findall(body), ["12", "34", "56", "78"])
+
+    def test_not_references(self):
+        """Cross-repository references, HTML entities and other words are not issues of this repository."""
+        body = "See obophenotype/uberon#2426, uberon#1, &#123; and #123abc"
+        self.assertEqual(_ISSUE_RE.findall(body), [])
+
+
+class TestFilterPullRequests(unittest.TestCase):
+    """Test selecting pull requests by number from a listing sorted newest first."""
+
+    def test_range(self):
+        """Only the pull requests in range are yielded, and the listing is left once the range is passed."""
+        listed = []
+
+        def listing():
+            for number in range(10, 0, -1):
+                listed.append(number)
+                yield number
+
+        self.assertEqual(list(_filter_pull_requests(listing(), 8, 5, number=int)), [8, 7, 6, 5])
+        self.assertEqual(listed, [10, 9, 8, 7, 6, 5, 4])
+
+    def test_pull_request_objects(self):
+        """Pull requests are numbered by their ``number`` attribute by default."""
+        prs = [mock.Mock(number=number) for number in (3, 2, 1)]
+        self.assertEqual(list(_filter_pull_requests(iter(prs), max_pr_number=2)), prs[1:])
+
+
+class TestGetIssueData(unittest.TestCase):
+    """Test fetching issues once per scrape."""
+
+    def test_cached(self):
+        """An issue is fetched once, and a pull request yields no issue data."""
+        repository = mock.Mock()
+        repository.get_issue.side_effect = lambda number: _issue(
+            number, pull_request=mock.Mock() if number == 2 else None
+        )
+        issue_cache = {}
+        issue_data = _get_issue_data(repository, 1, issue_cache)
+        self.assertEqual(issue_data[ISSUE_NUMBER_KEY], 1)
+        self.assertIs(_get_issue_data(repository, 1, issue_cache), issue_data)
+        self.assertIsNone(_get_issue_data(repository, 2, issue_cache))
+        self.assertIsNone(_get_issue_data(repository, 2, issue_cache))
+        self.assertEqual([c.args for c in repository.get_issue.call_args_list], [(1,), (2,)])
+
+    def test_single_flight(self):
+        """Concurrent requests for an issue wait for the one fetch in flight."""
+        fetching = threading.Event()
+        release = threading.Event()
+
+        def get_issue(number):
+            fetching.set()
+            release.wait(5)
+            return _issue(number)
+
+        repository = mock.Mock()
+        repository.get_issue.side_effect = get_issue
+        issue_cache = {}
+        results = []
+        first = threading.Thread(target=lambda: results.append(_get_issue_data(repository, 1, issue_cache)))
+        first.start()
+        self.assertTrue(fetching.wait(5))
+        second = threading.Thread(target=lambda: results.append(_get_issue_data(repository, 1, issue_cache)))
+        second.start()
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(repository.get_issue.call_count, 1)
+        self.assertEqual(len(results), 2)
+        self.assertIs(results[0], results[1])
+
+    def test_failure_evicted(self):
+        """A failed fetch is raised and forgotten, so a later request fetches the issue again."""
+        repository = mock.Mock()
+        repository.get_issue.side_effect = [RuntimeError("boom"), _issue(1)]
+        issue_cache = {}
+        with self.assertRaises(RuntimeError):
+            _get_issue_data(repository, 1, issue_cache)
+        self.assertEqual(issue_cache, {})
+        self.assertEqual(_get_issue_data(repository, 1, issue_cache)[ISSUE_NUMBER_KEY], 1)
+
+
+class TestGraphqlPrEntry(unittest.TestCase):
+    """Test collecting pull request data from GraphQL nodes."""
+
+    def test_entry(self):
+        """Review comments are flattened, and the file URLs point at the base and head commits."""
+        pr_entry = _graphql_pr_entry("pato-ontology/pato", _graphql_node())
+        self.assertEqual(pr_entry[PR_NUMBER_KEY], "pr571")
+        self.assertEqual(pr_entry[PR_COMMENTS_KEY], ["first", "reply", "second"])
+        self.assertEqual([issue[ISSUE_NUMBER_KEY] for issue in pr_entry[PR_CLOSED_ISSUES_KEY]], [263])
+        (changed_file,) = pr_entry[PR_CHANGED_FILES_KEY]
+        self.assertEqual(
+            changed_file[URL_IN_MAIN_KEY], "https://github.com/pato-ontology/pato/raw/base/src/ontology/pato-edit.obo"
+        )
+        self.assertEqual(
+            changed_file[URL_IN_PR_KEY], "https://github.com/pato-ontology/pato/raw/head/src/ontology/pato-edit.obo"
+        )
+
+    def test_skipped(self):
+        """Unmerged pull requests, and those not changing the resource or closing no issue, are skipped."""
+        for node in (_graphql_node(merged=False), _graphql_node(files=()), _graphql_node(issue_numbers=())):
+            with self.subTest(node=node):
+                self.assertIsNone(_graphql_pr_entry("pato-ontology/pato", node))
+
+
+class TestPrNumbers(unittest.TestCase):
+    """Test collecting the pull requests already in a data file, to resume a run."""
+
+    def test_analyzed_output(self):
+        """The metadata of an analyzed output is skipped, also while no pull request has been written."""
+        metadata = {"date_executed": "2024-09-01 00:00:00", "github_url": "https://github.com/pato-ontology/pato"}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_file = Path(tmp_dir) / "data_with_changes.yaml"
+            output_file.write_text(yaml.safe_dump(metadata))
+            self.assertEqual(_pr_numbers(output_file), set())
+            pull_requests = [{PR_NUMBER_KEY: "pr12", "changes": ["create X:1"]}, {PR_NUMBER_KEY: "pr3"}]
+            output_file.write_text(yaml.safe_dump({**metadata, PULL_REQUESTS_KEY: pull_requests}))
+            self.assertEqual(_pr_numbers(output_file), {12, 3})
+
+
+class TestAnalyzeScratchDir(unittest.TestCase):
+    """Test that analyze leaves no temporary ontology files behind."""
+
+    def setUp(self):
+        """Analyze a repository in a temporary project directory, with one PR scraped and already analyzed."""
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.scratch = Path(tmp_dir.name) / "scratch"
+        self.repo_dir = Path(tmp_dir.name) / "pato-ontology_pato"
+        self.repo_dir.mkdir()
+        (self.repo_dir / "raw_data.yaml").write_text(yaml.safe_dump({PR_NUMBER_KEY: "pr1"}))
+        self.output_file = self.repo_dir / "data_with_changes.yaml"
+        self.output_file.write_text(yaml.safe_dump({PULL_REQUESTS_KEY: [{PR_NUMBER_KEY: "pr1"}]}))
+        for patcher in (
+            mock.patch("ontodiff_curator.main.PROJECT_DIR", Path(tmp_dir.name)),
+            mock.patch("ontodiff_curator.main.scratch_dir", return_value=self.scratch),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_already_analyzed(self):
+        """No scratch directory is created when there is nothing to analyze."""
+        analyze_repo("pato-ontology/pato", "token", str(self.output_file), overwrite=False)
+        self.assertFalse(self.scratch.exists())
+
+    def test_failure(self):
+        """The scratch directory is removed when the analysis fails."""
+        with mock.patch("ontodiff_curator.main.ProcessPoolExecutor", side_effect=RuntimeError("ROBOT failed")):
+            with self.assertRaises(RuntimeError):
+                analyze_repo("pato-ontology/pato", "token", str(self.output_file))
+        self.assertFalse(self.scratch.exists())
+
+
+class TestLoadAdapter(unittest.TestCase):
+    """Test caching the ontologies loaded by an analyze worker."""
+
+    def setUp(self):
+        """Set up the worker state with an OBO cache directory and a stub loader."""
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.obo_cache_dir = Path(tmp_dir.name)
+        worker = {
+            "adapters": OrderedDict(),
+            "adapters_lock": threading.Lock(),
+            "obo_cache_dir": self.obo_cache_dir,
+            "tmp_dir": self.obo_cache_dir,
+        }
+        for patcher in (
+            mock.patch.dict(main._worker, worker),
+            mock.patch("ontodiff_curator.main.get_adapter", side_effect=lambda _: object()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def url(self, sha, content="format-version: 1.2\n"):
+        """Cache the resource of a commit and return its URL."""
+        (self.obo_cache_dir / f"{sha}.obo").write_text(content)
+        return f"https://github.com/pato-ontology/pato/raw/{sha}/src/ontology/pato-edit.obo"
+
+    def test_same_content(self):
+        """A resource is loaded once per URL, and once for all commits where it is unchanged."""
+        url, other_url = self.url("a"), self.url("b")
+        adapter = _load_adapter(url)
+        self.assertIs(_load_adapter(url), adapter)
+        self.assertIs(_load_adapter(other_url), adapter)
+        self.assertEqual(main.get_adapter.call_count, 1)
+
+    def test_bounded(self):
+        """At most ADAPTER_CACHE_SIZE adapters are held, the least recently used one being dropped first."""
+        urls = [self.url(str(number), f"date: {number}\n") for number in range(ADAPTER_CACHE_SIZE + 1)]
+        adapters = [_load_adapter(url) for url in urls]
+        self.assertEqual(len(main._worker["adapters"]), ADAPTER_CACHE_SIZE)
+        self.assertIs(_load_adapter(urls[-1]), adapters[-1])
+        self.assertIsNot(_load_adapter(urls[0]), adapters[0])
+
+
+class TestFindRawData(unittest.TestCase):
+    """Test finding the scraped data file to analyze."""
+
+    def test_formats(self):
+        """The data file is found in any format scrape writes, the msgpack one by default."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo_dir = Path(tmp_dir)
+            self.assertEqual(_find_raw_data(repo_dir), repo_dir / "raw_data.msgpack")
+            for filename in ("raw_data.msgpack", "raw_data.jsonl", "raw_data.yaml"):
+                with self.subTest(filename=filename):
+                    (repo_dir / filename).touch()
+                    self.assertEqual(_find_raw_data(repo_dir), repo_dir / filename)
+                    (repo_dir / filename).unlink()
+
+    def test_several_formats(self):
+        """Data files in several formats are ambiguous."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            repo_dir = Path(tmp_dir)
+            (repo_dir / "raw_data.msgpack").touch()
+            (repo_dir / "raw_data.jsonl").touch()
+            with self.assertRaises(ValueError):
+                _find_raw_data(repo_dir)
+
+
+class TestProgress(unittest.TestCase):
+    """Test recording the progress of a scrape."""
+
+    def setUp(self):
+        """Create a temporary directory for the progress file."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.progress_file = _progress_file(Path(self.tmp_dir.name) / "raw_data.msgpack")
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_progress_file(self):
+        """Each output has a progress file of its own."""
+        self.assertEqual(self.progress_file.name, "raw_data.progress.json")
+        self.assertNotEqual(_progress_file(Path(self.tmp_dir.name) / "other.jsonl"), self.progress_file)
+
+    def test_no_progress(self):
+        """Without a progress file there is nothing to resume."""
+        self.assertIsNone(_read_progress(self.progress_file))
+
+    def test_round_trip(self):
+        """The last recorded pull request is read back, and no partial file is left behind."""
+        _write_progress(self.progress_file, 120)
+        _write_progress(self.progress_file, 110)
+        self.assertEqual(_read_progress(self.progress_file), 110)
+        self.assertEqual(list(Path(self.tmp_dir.name).iterdir()), [self.progress_file])
+
+
+class TestResumeMaxPrNumber(unittest.TestCase):
+    """Test narrowing the range of a resumed scrape."""
+
+    def test_no_progress(self):
+        """Without progress the requested range is kept."""
+        self.assertIsNone(_resume_max_pr_number(None, None))
+        self.assertEqual(_resume_max_pr_number(500, None), 500)
+
+    def test_unbounded(self):
+        """Without an upper bound the scrape resumes just below the last pull request handled."""
+        self.assertEqual(_resume_max_pr_number(None, 300), 299)
+
+    def test_bounded(self):
+        """The lower of the requested bound and the resume point wins."""
+        self.assertEqual(_resume_max_pr_number(500, 300), 299)
+        self.assertEqual(_resume_max_pr_number(200, 300), 200)
+
+
+class TestSpansManyPrs(unittest.TestCase):
+    """Test deciding whether to list all issues and comments up front."""
+
+    def test_unbounded(self):
+        """The whole history spans many pull requests."""
+        self.assertTrue(_spans_many_prs(None, None))
+
+    def test_small_range(self):
+        """A small range, such as only the first hundred pull requests, does not."""
+        self.assertFalse(_spans_many_prs(100, None))
+        self.assertFalse(_spans_many_prs(5100, 5001))
+
+    def test_large_range(self):
+        """A range of at least PREFETCH_MIN_PRS numbers does."""
+        self.assertTrue(_spans_many_prs(PREFETCH_MIN_PRS, None))
+        self.assertTrue(_spans_many_prs(9000, 1000))
+
+    def test_lower_bound_only(self):
+        """A range with only a lower bound is of unknown size."""
+        self.assertFalse(_spans_many_prs(None, 5000))
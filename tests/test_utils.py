@@ -0,0 +1,305 @@
+"""Tests for the utility functions."""
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+import requests_cache
+import yaml
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3 import HTTPResponse
+
+from ontodiff_curator.constants import PR_NUMBER_KEY, PULL_REQUESTS_KEY
+from ontodiff_curator.utils import (
+    RateLimitMonitor,
+    commit_sha_from_url,
+    download_file,
+    dump_pull_requests,
+    file_digest,
+    install_cache,
+    iter_pull_requests,
+    pacing_delay,
+    prune_cache,
+    remove_import_lines,
+    truncate_partial_record,
+)
+
+ENTRIES = [
+    {PR_NUMBER_KEY: "pr1", "pr_title": "First"},
+    {PR_NUMBER_KEY: "pr2", "pr_title": "Second"},
+]
+
+
+class TestIterPullRequests(unittest.TestCase):
+    """Test reading scraped pull requests."""
+
+    def setUp(self):
+        """Create a temporary directory for the data files."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.tmp_dir.name) / "raw_data.yaml"
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        self.tmp_dir.cleanup()
+
+    def test_multi_document(self):
+        """One document per pull request."""
+        with open(self.data_path, "w") as file:
+            for entry in ENTRIES:
+                yaml.dump(entry, file, explicit_start=True, sort_keys=False)
+        self.assertEqual(list(iter_pull_requests(self.data_path)), ENTRIES)
+
+    def test_single_document(self):
+        """A single document with a top-level pull_requests list."""
+        with open(self.data_path, "w") as file:
+            yaml.dump({PULL_REQUESTS_KEY: ENTRIES}, file, sort_keys=False)
+        self.assertEqual(list(iter_pull_requests(self.data_path)), ENTRIES)
+
+    def test_dump_round_trip(self):
+        """Pull requests dumped in any format are read back, also when appended over several runs."""
+        for suffix in (".msgpack", ".jsonl", ".yaml"):
+            with self.subTest(suffix=suffix):
+                data_path = self.data_path.with_suffix(suffix)
+                for entry in ENTRIES:
+                    with open(data_path, "ab") as file:
+                        dump_pull_requests(iter([entry]), file, data_path)
+                self.assertEqual(list(iter_pull_requests(data_path)), ENTRIES)
+
+    def test_partial_msgpack_record(self):
+        """A msgpack record cut short is an error, not the end of the file."""
+        data_path = self.data_path.with_suffix(".msgpack")
+        with open(data_path, "wb") as file:
+            dump_pull_requests(iter(ENTRIES), file, data_path)
+        data_path.write_bytes(data_path.read_bytes()[:-3])
+        with self.assertRaises(ValueError):
+            list(iter_pull_requests(data_path))
+
+    def test_resume_after_partial_record(self):
+        """Pull requests appended after an interrupted write are read back once the partial record is removed."""
+        for suffix in (".msgpack", ".jsonl"):
+            with self.subTest(suffix=suffix):
+                data_path = self.data_path.with_suffix(suffix)
+                with open(data_path, "wb") as file:
+                    dump_pull_requests(iter(ENTRIES), file, data_path)
+                data_path.write_bytes(data_path.read_bytes()[:-3])
+                truncate_partial_record(data_path)
+                with open(data_path, "ab") as file:
+                    dump_pull_requests(iter(ENTRIES[1:]), file, data_path)
+                self.assertEqual(list(iter_pull_requests(data_path)), ENTRIES)
+
+    def test_complete_file_kept(self):
+        """A file ending with a complete record is left as it is."""
+        for suffix in (".msgpack", ".jsonl", ".yaml"):
+            with self.subTest(suffix=suffix):
+                data_path = self.data_path.with_suffix(suffix)
+                with open(data_path, "wb") as file:
+                    dump_pull_requests(iter(ENTRIES), file, data_path)
+                contents = data_path.read_bytes()
+                truncate_partial_record(data_path)
+                self.assertEqual(data_path.read_bytes(), contents)
+
+
+class TestCommitShaFromUrl(unittest.TestCase):
+    """Test extracting commit SHAs from raw GitHub URLs."""
+
+    def test_commit_sha_from_url(self):
+        """The SHA follows the raw path segment."""
+        url = "https://github.com/pato-ontology/pato/raw/518536fde399913268bc945493bed936d4fc0f7e/src/ontology/pato-edit.obo"
+        self.assertEqual(commit_sha_from_url(url), "518536fde399913268bc945493bed936d4fc0f7e")
+
+
+def _session(lines):
+    """Mock a session streaming a file of the given lines."""
+    response = mock.MagicMock()
+    response.__enter__.return_value = response
+    response.iter_lines.return_value = iter(lines)
+    response.iter_content.return_value = iter([b"".join(line + b"\n" for line in lines)])
+    return mock.Mock(get=mock.Mock(return_value=response))
+
+
+class TestDownloadFile(unittest.TestCase):
+    """Test downloading ontology files."""
+
+    LINES = [b"Prefix(:=<http://x/>)", b"Import(<http://x/y.owl>)", b"Declaration(Class(:A))"]
+
+    def test_download(self):
+        """The body is written as is, with the token sent along."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "x.owl"
+            session = _session(self.LINES)
+            download_file("https://github.com/x/y/raw/sha/x.owl", file_path, "token", session=session)
+            self.assertEqual(file_path.read_bytes(), b"".join(line + b"\n" for line in self.LINES))
+            self.assertEqual(session.get.call_args.kwargs["headers"], {"Authorization": "token token"})
+
+    def test_skip_lines(self):
+        """Lines starting with the given prefix are dropped while the file is written."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "x.owl"
+            session = _session(self.LINES)
+            download_file("https://github.com/x/y/raw/sha/x.owl", file_path, "token", session, b"Import")
+            self.assertEqual(file_path.read_bytes(), b"Prefix(:=<http://x/>)\nDeclaration(Class(:A))\n")
+
+    def test_failed_download(self):
+        """A failed download leaves no file behind."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "x.owl"
+            file_path.write_bytes(b"partial")
+            session = mock.Mock(get=mock.Mock(side_effect=requests.exceptions.ConnectionError("reset")))
+            download_file("https://github.com/x/y/raw/sha/x.owl", file_path, "token", session=session)
+            self.assertFalse(file_path.exists())
+
+
+class TestFileDigest(unittest.TestCase):
+    """Test hashing downloaded files."""
+
+    def test_file_digest(self):
+        """The digest is the SHA-256 of the whole file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / "x.obo"
+            file_path.write_bytes(b"format-version: 1.2\n")
+            self.assertEqual(file_digest(file_path), hashlib.sha256(b"format-version: 1.2\n").hexdigest())
+
+
+class _MaxAgeAdapter(BaseAdapter):
+    """Answer every request with a body cacheable for five minutes, as raw.githubusercontent.com does."""
+
+    def send(self, request, **kwargs):
+        raw = HTTPResponse(
+            body=io.BytesIO(b"format-version: 1.2\n"),
+            headers={"Cache-Control": "max-age=300"},
+            status=200,
+            preload_content=False,
+        )
+        return HTTPAdapter().build_response(request, raw)
+
+    def close(self):
+        pass
+
+
+class TestInstallCache(unittest.TestCase):
+    """Test which GitHub responses are cached."""
+
+    def setUp(self):
+        """Install an in-memory cache in front of a fake server."""
+        install_cache("memory")
+        self.addCleanup(requests_cache.uninstall_cache)
+        self.session = requests.Session()
+        self.session.mount("https://", _MaxAgeAdapter())
+
+    def test_api_cached(self):
+        """REST API responses are cached."""
+        self.session.get("https://api.github.com/repos/pato-ontology/pato/issues/1")
+        self.assertTrue(self.session.get("https://api.github.com/repos/pato-ontology/pato/issues/1").from_cache)
+
+    def test_not_cached(self):
+        """Raw files and the rate limit are never cached, whatever their Cache-Control header."""
+        for url in (
+            "https://raw.githubusercontent.com/pato-ontology/pato/sha/src/ontology/pato-edit.obo",
+            "https://github.com/pato-ontology/pato/raw/sha/src/ontology/pato-edit.obo",
+            "https://api.github.com/rate_limit",
+        ):
+            with self.subTest(url=url):
+                self.session.get(url, stream=True)
+                self.assertFalse(self.session.get(url, stream=True).from_cache)
+        self.assertEqual(list(self.session.cache.responses.keys()), [])
+
+
+class TestPacingDelay(unittest.TestCase):
+    """Test spreading the remaining requests until the rate limit resets."""
+
+    def test_pacing_delay(self):
+        """The time to the reset is divided between the remaining requests."""
+        self.assertEqual(pacing_delay(4000, 1000.0, 200.0), 0.2)
+
+    def test_exhausted(self):
+        """With no requests left the delay runs until the reset."""
+        self.assertEqual(pacing_delay(0, 1000.0, 200.0), 800.0)
+
+    def test_past_reset(self):
+        """A reset in the past means no delay."""
+        self.assertEqual(pacing_delay(10, 100.0, 200.0), 0.0)
+
+
+class TestRateLimitMonitor(unittest.TestCase):
+    """Test handing out request slots within the rate limit."""
+
+    def setUp(self):
+        """Create a monitor that never checks the rate limit itself, and record the delays it asks for."""
+        self.monitor = RateLimitMonitor(mock.Mock(), threshold=10)
+        patcher = mock.patch("ontodiff_curator.utils.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def delays(self, slots):
+        """Take a number of slots at once and return the delay of each."""
+        self.sleep.reset_mock()
+        for _ in range(slots):
+            self.monitor.wait()
+        return [call.args[0] for call in self.sleep.call_args_list]
+
+    def test_unchecked(self):
+        """Workers are not paced before the first check."""
+        self.assertEqual(self.delays(100), [0.0] * 100)
+
+    def test_burst(self):
+        """Workers are not paced while the remaining requests cover the slots taken."""
+        self.monitor._update(5000, 3600.0, 0.0)
+        self.assertEqual(self.delays(100), [0.0] * 100)
+
+    def test_paced_when_exhausted(self):
+        """Once the slots the remaining requests allow are taken, the next ones are spread until the reset."""
+        self.monitor._update(13, 130.0, 0.0)
+        delays = self.delays(5)
+        self.assertEqual(delays[:3], [0.0] * 3)
+        self.assertAlmostEqual(delays[3], 10.0, places=2)
+        self.assertAlmostEqual(delays[4], 20.0, places=2)
+
+    def test_cost(self):
+        """The requests used per slot since the last check shrink the slots the remaining requests allow."""
+        self.monitor._update(1000, 3600.0, 0.0)
+        self.delays(100)
+        # 400 requests for 100 slots, leaving (600 - 10) / 4 slots
+        self.monitor._update(600, 3600.0, 60.0)
+        self.assertEqual(self.monitor._cost, 4.0)
+        self.assertEqual(self.delays(147), [0.0] * 147)
+        self.assertGreater(self.delays(1)[0], 0.0)
+
+
+class TestPruneCache(unittest.TestCase):
+    """Test keeping a cache directory within its size."""
+
+    def test_prune_cache(self):
+        """The least recently used files go first, and files still being written are left alone."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, name in enumerate(["a.obo", "b.obo", "c.obo"]):
+                path = Path(tmp_dir) / name
+                path.write_bytes(b"x" * 10)
+                os.utime(path, (i, i))
+                paths.append(path)
+            partial_path = Path(tmp_dir) / "d.123.part"
+            partial_path.write_bytes(b"x" * 100)
+            # "a" was used last
+            os.utime(paths[0], (10, 10))
+            prune_cache(tmp_dir, 20)
+            self.assertEqual(sorted(path.name for path in Path(tmp_dir).iterdir()), ["a.obo", "c.obo", "d.123.part"])
+            prune_cache(tmp_dir, 0)
+            self.assertEqual([path.name for path in Path(tmp_dir).iterdir()], ["d.123.part"])
+
+
+class TestRemoveImportLines(unittest.TestCase):
+    """Test removing import lines from OWL files."""
+
+    def test_remove_import_lines(self):
+        """Only the lines starting with Import are removed, and no other file is left behind."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            owl_file = Path(tmp_dir) / "x.owl"
+            owl_file.write_text("Prefix(:=<http://x/>)\nImport(<http://x/y.owl>)\nDeclaration(Class(:A))\n")
+            remove_import_lines(owl_file)
+            self.assertEqual(owl_file.read_text(), "Prefix(:=<http://x/>)\nDeclaration(Class(:A))\n")
+            self.assertEqual(list(Path(tmp_dir).iterdir()), [owl_file])
@@ -0,0 +1,117 @@
+"""Tests for the fast YAML emitter."""
+
+import io
+import unittest
+
+import yaml
+
+from ontodiff_curator.constants import CHANGES_KEY, PULL_REQUESTS_KEY
+from ontodiff_curator.yaml_fast import CHANGE_PREFIX, LinePrefixWriter, changes_header
+
+TRICKY_STRINGS = [
+    "",
+    "plain text",
+    "Fixes #263",
+    "#263",
+    "key: value",
+    "trailing colon:",
+    " leading space",
+    "trailing space ",
+    "- dash",
+    "@anitacaron can you close this?",
+    "line one\r\nline two",
+    "tab\tseparated",
+    "yes",
+    "null",
+    "~",
+    "123",
+    "1:20",
+    "2024-09-01",
+    "0x1F",
+    ".inf",
+    "'quoted'",
+    '"double"',
+    "back\\slash",
+    "café   \x85 \x7f",
+    "emoji \U0001f600",
+    "\x1b[0m x",
+    "\x00",
+    "rename UBERON:0000001 from 'a' to 'b'",
+]
+
+
+def _round_trip(pr_entry, changes):
+    """Emit a pull request as analyze_repo does and load it back."""
+    out = io.StringIO()
+    out.write(f"{PULL_REQUESTS_KEY}:\n")
+    out.write(changes_header(pr_entry))
+    stream = LinePrefixWriter(out, CHANGE_PREFIX)
+    for change in changes:
+        stream.write(f"{change}\n")
+    return yaml.safe_load(out.getvalue())[PULL_REQUESTS_KEY][0]
+
+
+class TestChangesHeader(unittest.TestCase):
+    """Test the fast YAML emitter of pull requests against PyYAML's loader."""
+
+    def test_tricky_strings(self):
+        """Strings that need quoting survive a round trip."""
+        for value in TRICKY_STRINGS:
+            with self.subTest(value=value):
+                loaded = _round_trip({"id": "pr1", "pr_body": value}, ["create X:1"])
+                self.assertEqual(loaded, {"id": "pr1", "pr_body": value, CHANGES_KEY: ["create X:1"]})
+
+    def test_nested_entry(self):
+        """Nested lists and mappings survive a round trip."""
+        pr_entry = {
+            "id": "pr571",
+            "pr_title": "Expand ORCIDs",
+            "pr_body": None,
+            "pr_labels": [],
+            "pr_comments": ["first", "second: comment"],
+            "pr_closed_issues": [
+                {"issue_number": 263, "issue_title": "Standardise orcids", "issue_labels": ["bug"]},
+                {"issue_number": 264, "issue_title": "Other", "issue_labels": []},
+            ],
+        }
+        changes = ["create edge X:1 rdfs:subClassOf X:2", "delete edge X:3 rdfs:subClassOf X:4"]
+        self.assertEqual(_round_trip(pr_entry, changes), {**pr_entry, CHANGES_KEY: changes})
+
+
+class TestLinePrefixWriter(unittest.TestCase):
+    """Test streaming change lines into the output."""
+
+    def test_tricky_strings(self):
+        """Lines that need quoting survive a round trip."""
+        for value in TRICKY_STRINGS:
+            if "\n" in value:
+                continue
+            with self.subTest(value=value):
+                self.assertEqual(_round_trip({"id": "pr1"}, [value]), {"id": "pr1", CHANGES_KEY: [value]})
+
+    def test_streamed_changes(self):
+        """Lines written in arbitrary chunks become items of the changes sequence."""
+        out = io.StringIO()
+        out.write(f"{PULL_REQUESTS_KEY}:\n{changes_header({'id': 'pr1'})}")
+        stream = LinePrefixWriter(out, CHANGE_PREFIX)
+        stream.write("create X:1\nrename X:2 from 'a' ")
+        stream.write("to 'b: c'\n")
+        stream.write("delete X:3")
+        stream.flush()
+        self.assertEqual(stream.lines_written, 3)
+        self.assertEqual(
+            yaml.safe_load(out.getvalue()),
+            {
+                PULL_REQUESTS_KEY: [
+                    {"id": "pr1", CHANGES_KEY: ["create X:1", "rename X:2 from 'a' to 'b: c'", "delete X:3"]}
+                ]
+            },
+        )
+
+    def test_no_changes(self):
+        """Nothing is written without lines."""
+        out = io.StringIO()
+        stream = LinePrefixWriter(out, CHANGE_PREFIX)
+        stream.flush()
+        self.assertEqual(stream.lines_written, 0)
+        self.assertEqual(out.getvalue(), "")